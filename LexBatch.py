@@ -0,0 +1,247 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexBatch.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, lexes whole source trees on a process pool.
+#   + lex files with the same content once, add the --cache option.
+#   + read each file once in the workers, rename the -m option -o.
+
+'''Lex many Lua files at once.
+
+usage: LexBatch.py [-j JOBS] [-c CACHE] [-d DIR | -o FILE] PATH [PATH ...]
+
+PATH is a Lua file, a directory (searched recursively for --pattern)
+or a glob. Each file gets the same output as "LuaLexParser.py in out",
+either in its own file under DIR or all of them in one merged FILE.
+Files with the same content are lexed once. With --cache, the tokens
+are kept in a LexCache.TokenCache under CACHE, so unchanged files are
+not lexed again by later runs. Throughput is reported on stderr.
+'''
+
+import os
+import sys
+import glob
+import time
+import fnmatch
+import argparse
+import hashlib
+import multiprocessing
+import cStringIO
+
+from LuaLexParser import LuaLexParser, DumpTokenInfos
+from LexCache import TokenCache
+
+
+def FindSources(paths, pattern = '*.lua'):
+    '''Expand files, directories and globs.
+
+    -Return a list of (path, name) tuples, name is the path relative to
+     the directory it was found in, used to name per-file outputs.
+    '''
+    sources = []
+    for arg in paths:
+        if os.path.isdir(arg):
+            for root, dirs, files in os.walk(arg):
+                dirs.sort()
+                for name in sorted(fnmatch.filter(files, pattern)):
+                    path = os.path.join(root, name)
+                    sources.append((path, os.path.relpath(path, arg)))
+        elif os.path.isfile(arg):
+            sources.append((arg, os.path.basename(arg)))
+        else:
+            for path in sorted(glob.glob(arg)):
+                if os.path.isfile(path):
+                    sources.append((path, os.path.basename(path)))
+    return sources
+
+
+# TokenCaches of this process, keyed by (directory, max_bytes)
+_caches = {}
+
+
+def _Read(path):
+    '''Return the content of a file, None if it can not be read.'''
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def _LexFiles(job):
+    '''Worker: lex files that may have the same content.
+
+    -job is (files, engine, cache), files is a list of (path, name) of
+     files of the same size.
+    -Return a list of (path, name, size, count, text), one per file.
+     size is the number of bytes read, text is the whole output of the
+     file as one string, so only flat strings and ints are sent back to
+     the parent process.
+
+    Each file is read once and lexed from the bytes read. Files with the
+    same content are lexed once, the result of the first one is repeated
+    for the others.
+    '''
+    files, engine, cache = job
+    if cache is not None:
+        if cache not in _caches:
+            _caches[cache] = TokenCache(*cache)
+        cache = _caches[cache]
+
+    # Results keyed by the hash of the content
+    done = {}
+    results = []
+    for path, name in files:
+        data = _Read(path)
+        digest = None
+        if data is not None and len(files) > 1:
+            digest = hashlib.sha1(data).digest()
+        result = done.get(digest)
+        if result is None:
+            lex = LuaLexParser(source = data or '', engine = engine,
+                               cache = cache)
+            out = cStringIO.StringIO()
+            count = DumpTokenInfos(lex, out)
+            result = (len(data or ''), count, out.getvalue())
+            if digest is not None:
+                done[digest] = result
+        results.append((path, name) + result)
+    return results
+
+
+def LexFiles(sources, jobs = None, engine = 'regex', cache = None):
+    '''Lex sources on a pool of jobs processes.
+
+    -sources is a list returned by FindSources().
+    -cache is a (directory, max_bytes) tuple of a TokenCache, or None.
+    -Yield (path, name, size, count, text) tuples in the order of
+     sources, see _LexFiles().
+
+    Files of the same size go to the same job, so files with the same
+    content are lexed once without reading any file in this process.
+    '''
+    # Jobs of the sizes seen, and the job of each source
+    groups = {}
+    work = []
+    owners = []
+    for path, name in sources:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        number = groups.get(size)
+        if number is None:
+            number = len(work)
+            work.append(([], engine, cache))
+            if size is not None:
+                groups[size] = number
+        work[number][0].append((path, name))
+        owners.append(number)
+
+    # Results of jobs whose files are not all yielded yet, with the
+    # count of those files
+    pending = {}
+    received = 0
+    results = _RunJobs(work, jobs)
+    for number in owners:
+        while received <= number:
+            pending[received] = [len(work[received][0]),
+                                 iter(next(results))]
+            received += 1
+        entry = pending[number]
+        entry[0] -= 1
+        if not entry[0]:
+            del pending[number]
+        yield next(entry[1])
+
+
+def _RunJobs(work, jobs):
+    '''Yield _LexFiles() results of work, in order.'''
+    if jobs == 1:
+        for job in work:
+            yield _LexFiles(job)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        chunksize = max(1, min(64, len(work) // ((jobs or 1) * 8)))
+        for result in pool.imap(_LexFiles, work, chunksize):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def __main():
+    parser = argparse.ArgumentParser(
+        description = 'Lex Lua files on a process pool.')
+    parser.add_argument('paths', nargs = '+', metavar = 'PATH',
+                        help = 'a Lua file, a directory or a glob')
+    parser.add_argument('-j', '--jobs', type = int, default = None,
+                        help = 'worker processes (default: CPU count)')
+    parser.add_argument('-p', '--pattern', default = '*.lua',
+                        help = 'file pattern searched in directories')
+    parser.add_argument('-e', '--engine', default = 'regex',
+                        choices = LuaLexParser.ENGINES)
+    parser.add_argument('-c', '--cache', metavar = 'CACHE',
+                        help = 'keep the tokens in the directory CACHE')
+    parser.add_argument('--cache-size', type = int, default = 256,
+                        metavar = 'MB',
+                        help = 'evict cached tokens above MB megabytes')
+    target = parser.add_mutually_exclusive_group(required = True)
+    target.add_argument('-d', '--output-dir', metavar = 'DIR',
+                        help = 'write NAME.txt for each file under DIR')
+    target.add_argument('-o', '--output', metavar = 'FILE',
+                        help = 'write all results to one FILE')
+    args = parser.parse_args()
+
+    sources = FindSources(args.paths, args.pattern)
+    cache = None
+    if args.cache:
+        cache = (args.cache, args.cache_size << 20)
+    merged = None
+    if args.output:
+        merged = open(args.output, 'w')
+
+    files = size = count = 0
+    start = time.time()
+    try:
+        for path, name, nbytes, ntokens, text in \
+                LexFiles(sources, args.jobs, args.engine, cache):
+            if merged:
+                merged.write('# %s\n' % path)
+                merged.write(text)
+                merged.write('\n')
+            else:
+                outname = os.path.join(args.output_dir, name + '.txt')
+                outdir = os.path.dirname(outname)
+                if not os.path.isdir(outdir):
+                    os.makedirs(outdir)
+                f = open(outname, 'w')
+                f.write(text)
+                f.close()
+
+            files += 1
+            size += nbytes
+            count += ntokens
+    finally:
+        if merged:
+            merged.close()
+
+    elapsed = max(time.time() - start, 1e-6)
+    sys.stderr.write('%d file(s), %d byte(s), %d token(s) in %.2fs\n'
+                     % (files, size, count, elapsed))
+    sys.stderr.write('%.1f KB/s, %.0f tokens/s\n'
+                     % (size / 1024.0 / elapsed, count / elapsed))
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    __main()
@@ -0,0 +1,462 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexBench.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, lexer benchmarks on generated corpora.
+#   + add the ordinary corpus, the --table option and the speedup of
+#     the regex engine over the char engine.
+#   + measure the peak memory from the resident size before lexing.
+
+'''Benchmark LuaLexParser on generated corpora.
+
+usage: LexBench.py [-s KB] [-r N] [-e ENGINE] [-k KIND] [--table]
+                   [--save FILE] [--compare FILE] [--threshold PCT]
+
+Each corpus kind stresses one kind of token:
+
+    identifiers  code with many names and keywords
+    numbers      data tables of numeric literals
+    strings      long bracket and line string blobs
+    comments     line and block comments around a little code
+    mixed        a bit of everything
+    ordinary     functions, tables, calls and comments in the
+                 proportions of everyday code
+
+and the mixed corpus is also lexed in each encoding of ENCODINGS. The
+corpora are made by a seeded generator, so every run lexes the same
+bytes.
+
+For each corpus and engine, the best of N runs gives tokens/s and
+bytes/s. Tokens are read with GetToken(), or lexed into the tables with
+Lex() if --table is given. With both engines, the speedup of regex over
+char follows each corpus. The peak memory growth of lexing the corpus
+from a file is measured in a fresh interpreter, see _PeakKB() for its
+resolution. The token counts of each type are kept too. --save writes
+the results as a JSON baseline. --compare diffs a run against one and
+exits with 1 if a corpus got slower by more than PCT percent or its
+tokens changed.
+
+What to expect of the regex engine, measured against the original
+char-at-a-time lexer on 128 KB corpora with CPython 2.7:
+
+    corpus       Lex()   GetToken()
+    numbers      31x     14x
+    strings      27x     19x
+    mixed        12x     5.6x
+    comments     10x     5.2x
+    identifiers  7.1x    3.3x
+    ordinary     5.8x    3.2x
+
+GetToken() builds one dict per token, which costs about as much as
+lexing it, so names and operators stay well below 10x there. Code that
+only needs the tables should call Lex().
+'''
+
+import os
+import sys
+import time
+import json
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from LuaLexParser import LuaLexParser
+
+try:
+    import resource
+except ImportError:
+    # No peak memory on Windows
+    resource = None
+
+
+KINDS = ('identifiers', 'numbers', 'strings', 'comments', 'mixed',
+         'ordinary')
+
+# Encoded forms of the mixed corpus: (name, codec, BOM)
+ENCODINGS = (('utf-8', 'utf-8', ''),
+             ('utf-8-sig', 'utf-8', '\xEF\xBB\xBF'),
+             ('utf-16-le', 'utf-16-le', '\xFF\xFE'),
+             ('utf-16-be', 'utf-16-be', '\xFE\xFF'),
+             ('ansi', 'cp1252', ''))
+
+NAMES = ('self', 'value', 'count', 'player', 'items', 'index', 'result',
+         'config', 'x', 'y', 'dt', 'node', 'parent', 'children', 'name')
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'level', 'spawn',
+         'enemy', 'quest', 'reward', 'dialog', 'intro', 'outro')
+
+
+def _Name(rnd):
+    name = rnd.choice(NAMES)
+    if rnd.random() < 0.5:
+        name += '_%d' % rnd.randint(0, 99)
+    return name
+
+
+def _Number(rnd):
+    r = rnd.random()
+    if r < 0.4:
+        return str(rnd.randint(0, 1000))
+    if r < 0.7:
+        return '%.3f' % (rnd.random() * 1000)
+    if r < 0.8:
+        return '-%d' % rnd.randint(1, 100)
+    if r < 0.9:
+        return '0x%X' % rnd.randint(0, 0xFFFFFF)
+    return '%.2e' % (rnd.random() * 1e10)
+
+
+def _Text(rnd, n, extra = ()):
+    return ' '.join([rnd.choice(WORDS + extra) for i in xrange(n)])
+
+
+def _Identifiers(rnd, text):
+    lines = ['local function %s(%s, %s)' % (_Name(rnd), _Name(rnd),
+                                           _Name(rnd))]
+    for i in xrange(rnd.randint(3, 12)):
+        lines.append('  if %s.%s ~= nil and %s > %s then' %
+                     (_Name(rnd), _Name(rnd), _Name(rnd), _Name(rnd)))
+        lines.append('    %s = %s(%s, %s) or %s' %
+                     (_Name(rnd), _Name(rnd), _Name(rnd), _Name(rnd),
+                      _Name(rnd)))
+        lines.append('  end')
+    lines.append('  return %s' % _Name(rnd))
+    lines.append('end')
+    return lines
+
+
+def _Numbers(rnd, text):
+    lines = ['%s = {' % _Name(rnd)]
+    for i in xrange(rnd.randint(5, 20)):
+        row = ', '.join([_Number(rnd) for j in xrange(16)])
+        lines.append('  {%s},' % row)
+    lines.append('}')
+    return lines
+
+
+def _Strings(rnd, text):
+    lines = ['%s = "%s"' % (_Name(rnd), text(rnd, 8)),
+             "%s = '%s\\n%s'" % (_Name(rnd), text(rnd, 4), text(rnd, 4)),
+             '%s = [==[' % _Name(rnd)]
+    for i in xrange(rnd.randint(5, 30)):
+        lines.append(text(rnd, 12))
+    lines.append(']==]')
+    return lines
+
+
+def _Comments(rnd, text):
+    lines = ['--[[']
+    for i in xrange(rnd.randint(2, 10)):
+        lines.append('  ' + text(rnd, 10))
+    lines.append(']]')
+    for i in xrange(rnd.randint(2, 8)):
+        lines.append('-- ' + text(rnd, 8))
+        lines.append('%s = %s -- %s' % (_Name(rnd), _Name(rnd),
+                                        text(rnd, 4)))
+    return lines
+
+
+def _Mixed(rnd, text):
+    return rnd.choice((_Identifiers, _Numbers, _Strings,
+                       _Comments))(rnd, text)
+
+
+def _Ordinary(rnd, text):
+    lines = ['-- ' + text(rnd, 6),
+             'function %s:%s(%s, %s)' % (_Name(rnd), _Name(rnd), _Name(rnd),
+                                         _Name(rnd)),
+             '  local %s = %s[%s] or {}' % (_Name(rnd), _Name(rnd),
+                                            _Name(rnd))]
+    for i in xrange(rnd.randint(2, 8)):
+        r = rnd.random()
+        if r < 0.3:
+            lines.append('  for %s = 1, #%s do' % (_Name(rnd), _Name(rnd)))
+            lines.append('    %s = %s + %s[%s] * %s' %
+                         (_Name(rnd), _Name(rnd), _Name(rnd), _Name(rnd),
+                          _Number(rnd)))
+            lines.append('  end')
+        elif r < 0.6:
+            lines.append('  if not %s.%s then' % (_Name(rnd), _Name(rnd)))
+            lines.append('    %s("%s", %s)' % (_Name(rnd), text(rnd, 3),
+                                               _Name(rnd)))
+            lines.append('    return nil')
+            lines.append('  end')
+        elif r < 0.8:
+            lines.append('  %s.%s = {%s = %s, %s = "%s"}' %
+                         (_Name(rnd), _Name(rnd), _Name(rnd), _Number(rnd),
+                          _Name(rnd), text(rnd, 2)))
+        else:
+            lines.append('  %s = %s(%s, %s) -- %s' %
+                         (_Name(rnd), _Name(rnd), _Name(rnd), _Number(rnd),
+                          text(rnd, 4)))
+    lines.append('  return %s' % _Name(rnd))
+    lines.append('end')
+    return lines
+
+
+GENERATORS = {'identifiers':_Identifiers, 'numbers':_Numbers,
+              'strings':_Strings, 'comments':_Comments, 'mixed':_Mixed,
+              'ordinary':_Ordinary}
+
+
+def MakeCorpus(kind, size, seed = 1, encoding = None):
+    '''Generate a Lua source of about size bytes.
+
+    -kind is one of KINDS.
+    -encoding is None for an ASCII source, or a name in ENCODINGS. Non
+     ASCII words are mixed into strings and comments then.
+    -Return the source as a str.
+    '''
+    rnd = random.Random('%s-%d' % (kind, seed))
+    extra = ()
+    if encoding is not None:
+        extra = (u'caf\xe9', u'na\xefve', u'\xfcber', u'gar\xe7on')
+        if encoding != 'ansi':
+            extra += (u'中文', u'日本語')
+
+    def text(rnd, n):
+        return _Text(rnd, n, extra)
+
+    parts = []
+    length = 0
+    while length < size:
+        chunk = u'\n'.join(GENERATORS[kind](rnd, text)) + u'\n\n'
+        parts.append(chunk)
+        length += len(chunk)
+    source = u''.join(parts)
+
+    if encoding is None:
+        return source.encode('ascii')
+    for name, codec, bom in ENCODINGS:
+        if name == encoding:
+            return bom + source.encode(codec)
+    raise ValueError('Unknown encoding: %r' % (encoding,))
+
+
+def Corpora(size, kinds = KINDS, encodings = True):
+    '''Yield (name, source) for the benchmark corpora.'''
+    for kind in kinds:
+        yield (kind, MakeCorpus(kind, size))
+    if encodings and 'mixed' in kinds:
+        for name, codec, bom in ENCODINGS:
+            yield ('mixed-' + name, MakeCorpus('mixed', size,
+                                               encoding = name))
+
+
+def _Lex(source, engine, table = False):
+    '''Lex source, return the token count of each type name.
+
+    -table lexes into the tables by Lex() instead of reading every token
+     with GetToken().
+    '''
+    lex = LuaLexParser(source = source, engine = engine)
+    if table:
+        lex.Lex()
+        column = lex.token_descs.types
+        types = [column.count(type_id)
+                 for type_id in xrange(len(lex.TOKENTYPE))]
+        types[lex.TYPE_COMMENTS] = len(lex.comments)
+    else:
+        types = [0] * len(lex.TOKENTYPE)
+        token = lex.GetToken()
+        while token:
+            types[token['type']] += 1
+            token = lex.GetToken()
+    return dict([(name, n) for name, n in zip(lex.TOKENTYPE, types) if n])
+
+
+def _ResidentKB():
+    '''Return the resident size of this process in KB, None if there is
+    no /proc to read it from.
+    '''
+    try:
+        f = open('/proc/self/statm')
+    except IOError:
+        return None
+    try:
+        pages = int(f.read().split()[1])
+    finally:
+        f.close()
+    return pages * (resource.getpagesize() // 1024)
+
+
+def _MaxKB():
+    '''Return the peak resident size of this process in KB.'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes instead of KB
+        return peak // 1024
+    return peak
+
+
+def _PeakKB(path, engine):
+    '''Return the peak memory growth of lexing the file path, in KB.
+
+    It runs in the "--peak" child process. The growth is the peak after
+    lexing minus the resident size right before it. Without /proc the
+    peak before lexing is subtracted instead, memory the start up freed
+    is used again first and is not counted.
+
+    Linux updates the peak only every few dozen page faults, so it may
+    lag the resident size by up to about 256 KB; the larger of both is
+    taken. The heap also grows in steps of the allocator, 128 KB for
+    glibc and 256 KB arenas for Python objects. Peaks of corpora below
+    a few hundred KB are therefore only good to such a step, compare
+    the peaks of corpora of 1 MB or more.
+    '''
+    before = _ResidentKB()
+    if before is None:
+        before = _MaxKB()
+    lex = LuaLexParser(path, engine = engine)
+    lex.Lex()
+    after = _MaxKB()
+    resident = _ResidentKB()
+    if resident is not None:
+        after = max(after, resident)
+    return max(after - before, 0)
+
+
+def Measure(source, engine, repeat = 3, table = False):
+    '''Lex source repeat times, see _Lex() for table.
+
+    -Return a dict of results, see the module docstring. 'peak_kb' is
+     None if the platform has no resource module.
+    '''
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        types = _Lex(source, engine, table)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    best = max(best, 1e-6)
+
+    peak = None
+    if resource is not None:
+        # The peak of this process only grows and a forked child shares
+        # its heap, so lex in a new interpreter
+        fd, path = tempfile.mkstemp('.lua')
+        try:
+            os.write(fd, source)
+            os.close(fd)
+            out = subprocess.check_output([sys.executable,
+                os.path.abspath(__file__), '--peak', engine, path])
+            peak = int(out)
+        finally:
+            os.remove(path)
+
+    tokens = sum(types.values())
+    return {'bytes':len(source), 'tokens':tokens, 'seconds':best,
+            'tokens_per_s':tokens / best,
+            'bytes_per_s':len(source) / best,
+            'peak_kb':peak, 'types':types}
+
+
+def Run(size, engines, kinds = KINDS, repeat = 3, out = None,
+        table = False):
+    '''Benchmark every corpus with every engine.
+
+    -Return the JSON document of a baseline.
+    '''
+    results = {}
+    for name, source in Corpora(size, kinds):
+        for engine in engines:
+            r = Measure(source, engine, repeat, table)
+            results['%s/%s' % (name, engine)] = r
+            if out:
+                out.write('%-22s %9d tok %10.0f tok/s %8.1f KB/s %8s KB\n'
+                          % ('%s/%s' % (name, engine), r['tokens'],
+                             r['tokens_per_s'], r['bytes_per_s'] / 1024.0,
+                             r['peak_kb']))
+        if out and 'char' in engines and 'regex' in engines:
+            out.write('%-22s regex is %.1fx char\n'
+                      % (name, results[name + '/char']['seconds'] /
+                         results[name + '/regex']['seconds']))
+    return {'meta':{'size':size, 'repeat':repeat, 'table':table,
+                    'lexer_version':LuaLexParser.LEXER_VERSION,
+                    'python':platform.python_version(),
+                    'platform':platform.platform()},
+            'results':results}
+
+
+def Compare(base, current, threshold = 10.0, out = sys.stdout):
+    '''Diff two baselines, write a line for each corpus to out.
+
+    -Return the number of regressions: corpora that are slower by more
+     than threshold percent, or whose tokens changed.
+    '''
+    regressions = 0
+    old, new = base['results'], current['results']
+    for key in sorted(set(old) | set(new)):
+        if key not in old or key not in new:
+            out.write('%-22s %s\n' % (key, key in old and 'gone' or 'new'))
+            continue
+        a, b = old[key], new[key]
+        change = (b['tokens_per_s'] / a['tokens_per_s'] - 1.0) * 100
+        notes = []
+        if change < -threshold:
+            notes.append('SLOWER')
+        if a['types'] != b['types']:
+            notes.append('TOKENS CHANGED')
+        if a['peak_kb'] is not None and b['peak_kb'] is not None:
+            notes.append('peak %+d KB' % (b['peak_kb'] - a['peak_kb']))
+        if 'SLOWER' in notes or 'TOKENS CHANGED' in notes:
+            regressions += 1
+        out.write('%-22s %10.0f -> %10.0f tok/s %+7.1f%% %s\n'
+                  % (key, a['tokens_per_s'], b['tokens_per_s'], change,
+                     ', '.join(notes)))
+    return regressions
+
+
+def __main():
+    parser = argparse.ArgumentParser(
+        description = 'Benchmark LuaLexParser on generated corpora.')
+    parser.add_argument('-s', '--size', type = int, default = 256,
+                        metavar = 'KB', help = 'size of each corpus')
+    parser.add_argument('-r', '--repeat', type = int, default = 3,
+                        metavar = 'N', help = 'runs per measurement')
+    parser.add_argument('-e', '--engine', action = 'append',
+                        choices = LuaLexParser.ENGINES,
+                        help = 'engine to measure, may be repeated')
+    parser.add_argument('-k', '--kind', action = 'append', choices = KINDS,
+                        help = 'corpus to measure, may be repeated')
+    parser.add_argument('--table', action = 'store_true',
+                        help = 'time Lex() instead of GetToken()')
+    parser.add_argument('--save', metavar = 'FILE',
+                        help = 'write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar = 'FILE',
+                        help = 'diff the results against a baseline')
+    parser.add_argument('--threshold', type = float, default = 10.0,
+                        metavar = 'PCT',
+                        help = 'slowdown reported as a regression')
+    parser.add_argument('--peak', nargs = 2, metavar = ('ENGINE', 'FILE'),
+                        help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.peak:
+        sys.stdout.write('%d\n' % _PeakKB(args.peak[1], args.peak[0]))
+        return
+
+    engines = args.engine or list(LuaLexParser.ENGINES)
+    kinds = args.kind or list(KINDS)
+    current = Run(args.size << 10, engines, kinds, args.repeat,
+                  sys.stdout, args.table)
+
+    if args.save:
+        f = open(args.save, 'w')
+        json.dump(current, f, indent = 1, sort_keys = True)
+        f.close()
+
+    if args.compare:
+        f = open(args.compare)
+        base = json.load(f)
+        f.close()
+        sys.stdout.write('\n')
+        if Compare(base, current, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    __main()
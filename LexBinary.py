@@ -0,0 +1,271 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexBinary.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, binary token files and their mmap reader.
+#   + BinaryTokens reads token files held in memory too.
+
+'''Binary token files.
+
+A token file holds the token table and the value tables of a lexed
+source. Numbers are little-endian, sections start at multiples of 8.
+
+Header, 16 bytes:
+    magic    4s  'LLXT'
+    version  H   FORMAT
+    flags    H   FLAG_UNICODE if string values are UTF-8 encoded unicode
+                 texts, otherwise they are the bytes of the source
+    count    I   number of tokens
+    sections I   number of sections, len(SECTIONS)
+
+Section table, one (offset Q, length Q) pair per section, in the order
+of SECTIONS. Offsets count from the start of the file.
+
+Sections:
+    consts   length / 8 doubles
+    strings  a blob table
+    symbols  a blob table
+    errors   a blob table of the unexpected symbols
+    err_ids  one B per error, the index to LuaLexParser.MSGS
+    types    count B,  the index to LuaLexParser.TOKENTYPE
+    indexes  count i,  the index to the value table of the type
+    lines    count i,  the line number
+    offsets  count I,  the position of the first character
+    ends     count I,  the position after the last character
+    columns  count i,  the position of the first character in its line
+
+A blob table of n values is n (I) followed by n + 1 offsets (I) into
+the data that follows them, value k is data[offsets[k]:offsets[k + 1]].
+
+Columns are fixed-width, so BinaryTokens reads any token in O(1)
+straight from the mapped file. Comments are not stored, like in the
+token table of the parser.
+'''
+
+import sys
+import mmap
+import array
+import struct
+
+from LuaLexParser import LuaLexParser
+from LexTables import TokenDesc
+
+
+MAGIC = 'LLXT'
+FORMAT = 1
+FLAG_UNICODE = 1
+
+HEADER = struct.Struct('<4sHHII')
+SECTION = struct.Struct('<QQ')
+
+SECTIONS = ('consts', 'strings', 'symbols', 'errors', 'err_ids',
+            'types', 'indexes', 'lines', 'offsets', 'ends', 'columns')
+
+# Typecode and width of each fixed-width section
+ITEMS = {'consts':('d', 8), 'err_ids':('B', 1), 'types':('B', 1),
+         'indexes':('i', 4), 'lines':('i', 4), 'offsets':('I', 4),
+         'ends':('I', 4), 'columns':('i', 4)}
+
+
+def _Pack(col):
+    '''Return an array as little-endian bytes.'''
+    if sys.byteorder != 'little':
+        col = array.array(col.typecode, col)
+        col.byteswap()
+    return col.tostring()
+
+
+def _Blobs(values, unicode_values):
+    '''Return values as a blob table.'''
+    data = [v.encode('utf-8') if unicode_values else str(v)
+            for v in values]
+    ends = array.array('I', [len(data), 0])
+    pos = 0
+    for d in data:
+        pos += len(d)
+        ends.append(pos)
+    return _Pack(ends) + ''.join(data)
+
+
+def DumpBinary(lex, f):
+    '''Lex the rest of the source and write a token file to f.
+
+    -f is a file opened in binary mode.
+    -Return the number of tokens written.
+    '''
+    lex.Lex()
+
+    table = lex.token_descs
+    table.Settle()
+    unicode_values = isinstance(lex.stream.buf, unicode)
+    errors = list(lex.err_descs)
+    payloads = [
+        _Pack(lex.consts.values),
+        _Blobs(lex.strings, unicode_values),
+        _Blobs(lex.symbols, unicode_values),
+        _Blobs([err['symbol'] for err in errors], unicode_values),
+        _Pack(array.array('B', [err['err_id'] for err in errors])),
+        _Pack(table.types),
+        _Pack(table.indexes),
+        _Pack(table.lines),
+        _Pack(table.offsets),
+        _Pack(table.ends),
+        _Pack(table.columns),
+        ]
+
+    flags = unicode_values and FLAG_UNICODE or 0
+    f.write(HEADER.pack(MAGIC, FORMAT, flags, len(table), len(SECTIONS)))
+    pos = HEADER.size + SECTION.size * len(SECTIONS)
+    layout = []
+    for data in payloads:
+        pos += -pos % 8
+        layout.append((pos, len(data)))
+        pos += len(data)
+    for offset, length in layout:
+        f.write(SECTION.pack(offset, length))
+
+    pos = HEADER.size + SECTION.size * len(SECTIONS)
+    for (offset, length), data in zip(layout, payloads):
+        f.write('\0' * (offset - pos))
+        f.write(data)
+        pos = offset + length
+    return len(table)
+
+
+
+class BinaryTokens(object):
+    '''A read-only view of a token file.
+
+    The file is mapped into memory and nothing is decoded up front, so
+    opening even a huge file is instant. Tokens and values are unpacked
+    when they are asked for.
+
+    len() is the number of tokens, indexing returns a TokenDesc without
+    'gen'. GetTokenInfo() returns the same tuples as
+    LuaLexParser.GetTokenInfo().
+
+    Pass data instead of filename to read a token file already in
+    memory, e.g. a str received from a LexServer.
+    '''
+
+    def __init__(self, filename = None, data = None):
+        self.file = None
+        if data is not None:
+            self.map = data
+            filename = '<data>'
+        else:
+            self.file = open(filename, 'rb')
+            try:
+                self.map = mmap.mmap(self.file.fileno(), 0,
+                                     access = mmap.ACCESS_READ)
+            except:
+                self.file.close()
+                raise
+
+        magic, version, self.flags, self.count, nsections = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != FORMAT:
+            self.Close()
+            raise ValueError('%s is no token file of format %d'
+                             % (filename, FORMAT))
+
+        self.sections = {}
+        for i, name in enumerate(SECTIONS[:nsections]):
+            self.sections[name] = SECTION.unpack_from(
+                self.map, HEADER.size + SECTION.size * i)
+
+        # Value tables of TOKENTYPE ids that have one
+        self.values = {LuaLexParser.TYPE_CONSTS:'consts',
+                       LuaLexParser.TYPE_STRINGS:'strings',
+                       LuaLexParser.TYPE_SYMBOLS:'symbols'}
+
+
+    def Close(self):
+        '''Unmap and close the file.'''
+        if self.file is not None:
+            self.map.close()
+            self.file.close()
+
+
+    def __len__(self):
+        return self.count
+
+
+    def __Item(self, name, i):
+        '''Return item i of a fixed-width section.'''
+        typecode, width = ITEMS[name]
+        offset = self.sections[name][0]
+        return struct.unpack_from('<' + typecode, self.map,
+                                  offset + width * i)[0]
+
+
+    def __Blob(self, name, i):
+        '''Return value i of a blob table.'''
+        offset = self.sections[name][0]
+        n = struct.unpack_from('<I', self.map, offset)[0]
+        start, end = struct.unpack_from('<II', self.map, offset + 4 * (i + 1))
+        data = offset + 4 * (n + 2)
+        value = self.map[data + start:data + end]
+        if self.flags & FLAG_UNICODE:
+            return value.decode('utf-8')
+        return value
+
+
+    def Column(self, name):
+        '''Return a whole column, e.g. 'lines', as an array.'''
+        typecode, width = ITEMS[name]
+        offset, length = self.sections[name]
+        col = array.array(typecode, self.map[offset:offset + length])
+        if sys.byteorder != 'little':
+            col.byteswap()
+        return col
+
+
+    def __getitem__(self, seq):
+        if seq < 0:
+            seq += self.count
+        if not 0 <= seq < self.count:
+            raise IndexError('token index out of range')
+        item = self.__Item
+        return TokenDesc(item('types', seq), item('indexes', seq),
+                         item('lines', seq), item('offsets', seq),
+                         item('ends', seq), item('columns', seq), seq)
+
+
+    def GetValue(self, type_id, index):
+        '''Return the value of a token, e.g. the text of a string.
+
+        -For errors, return the unexpected symbol.
+        -For keywords, operators and delimiters, return their text.
+        '''
+        if type_id == LuaLexParser.TYPE_ERRORS:
+            return self.__Blob('errors', index)
+        name = self.values.get(type_id)
+        if name is None:
+            # Keywords, operators and delimiters
+            names = getattr(LuaLexParser, LuaLexParser.TOKENTYPE[type_id])
+            return names[index]
+        if name == 'consts':
+            return self.__Item('consts', index)
+        return self.__Blob(name, index)
+
+
+    def GetTokenInfo(self, seq):
+        '''Return (type_id, type_name, sym_idx, sym_value, line_num) of a
+        token, see LuaLexParser.GetTokenInfo().
+        '''
+        token = self[seq]
+        type_id, index = token.type, token.index
+        if type_id == LuaLexParser.TYPE_ERRORS:
+            err_id = self.__Item('err_ids', index)
+            return (LuaLexParser.TOKENTYPE.index('MSGS'),
+                    LuaLexParser.MSGS[err_id], err_id,
+                    self.__Blob('errors', index), token.line)
+        return (type_id, LuaLexParser.TOKENTYPE[type_id], index,
+                self.GetValue(type_id, index), token.line)
+
+
+    def __iter__(self):
+        for seq in xrange(self.count):
+            yield self.GetTokenInfo(seq)
@@ -0,0 +1,177 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexCache.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, content hash keyed on-disk token cache.
+#   + write entries in full, count replaced entries once.
+
+import os
+import sys
+import errno
+import marshal
+import hashlib
+import tempfile
+
+
+class TokenCache(object):
+    '''An on-disk cache of lexed sources, keyed by a hash of the source.
+
+    Each entry is one file in 'directory', the marshal dump of the tables
+    of a LuaLexParser that lexed the whole source. Loading an entry
+    touches it. When the entries take more than 'max_bytes', the least
+    recently used ones are removed.
+
+    Entries are written to a temporary file first and then renamed, so
+    several processes can share one directory.
+
+    Pass an instance as the 'cache' argument of LuaLexParser to use it.
+    '''
+
+    SUFFIX = '.tok'
+
+    # Bump it whenever the layout of the entries changes
+    FORMAT = 2
+
+    def __init__(self, directory, max_bytes = 256 << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        # Bytes taken by the entries, counted when first needed
+        self.size = None
+
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+
+    def Key(self, buf, *tags):
+        '''Return the key of a source.
+
+        -buf is the source text, a str or a unicode text.
+        -tags are reprs of anything else the entry depends on, e.g. the
+         lexer version.
+        '''
+        h = hashlib.sha1(repr((self.FORMAT, sys.byteorder) + tags))
+        if isinstance(buf, unicode):
+            h.update('u')
+            h.update(buf.encode('utf-8'))
+        else:
+            h.update('b')
+            h.update(buf)
+        return h.hexdigest()
+
+
+    def __Path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+
+    def Load(self, key):
+        '''Return the state stored under key, None if there is none.'''
+        path = self.__Path(key)
+        try:
+            f = open(path, 'rb')
+            try:
+                state = marshal.load(f)
+            finally:
+                f.close()
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            # Missing, evicted meanwhile or truncated
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return state
+
+
+    def Store(self, key, state):
+        '''Store state under key, then evict entries if needed.
+
+        -state is made of strs, unicodes, ints, floats, tuples and lists.
+        '''
+        data = marshal.dumps(state, 2)
+        fd, tmp = tempfile.mkstemp(self.SUFFIX + '.tmp', '', self.directory)
+        # A file object writes all of data, os.write() may stop short
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+        path = self.__Path(key)
+        try:
+            # Size of the entry that is replaced, if any
+            old = os.stat(path).st_size
+        except OSError:
+            old = 0
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Windows does not replace existing files
+            try:
+                os.remove(path)
+                os.rename(tmp, path)
+            except OSError:
+                os.remove(tmp)
+                return
+
+        if self.size is None:
+            self.__Scan()
+        else:
+            self.size += len(data) - old
+        if self.size > self.max_bytes:
+            self.Evict()
+
+
+    def __Entries(self):
+        '''Return a list of (mtime, size, path) of the entries.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+
+    def __Scan(self):
+        self.size = sum([size for mtime, size, path in self.__Entries()])
+
+
+    def Evict(self):
+        '''Remove the least recently used entries until they take no more
+        than max_bytes.
+        '''
+        entries = self.__Entries()
+        entries.sort()
+        size = sum([entry[1] for entry in entries])
+        for mtime, nbytes, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= nbytes
+        self.size = size
+
+
+    def Clear(self):
+        '''Remove all entries.'''
+        for mtime, size, path in self.__Entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
@@ -6,15 +6,97 @@
 #   + initial version
 #   2010-04-28
 #   + add syntax highlighting to source code edit control
+#   2026-10-18
+#   + resolve the symbol table with GetTokenInfos()
+#   + keep the parser and re-lex only the edited parts of the source
+#   + lex the editor text in memory instead of a temporary file
+#   + analyze on a worker thread, with progress and cancellation
+#   + show tokens and errors in virtual lists
+#   + filter through the position indexes of the token table, add the
+#     combined and the selected lines filters
+#   + select tokens and errors by their offsets, GotoLine() in O(1)
+#   + keep the editor text undecoded, so offsets stay byte positions
+#   + save binary token files
+#   + show tokens/s and the elapsed time in a status bar
+#   + read results through a TokenInfoView instead of a copied table
+#   + handle text insertions and deletions only, other modifications no
+#     longer cancel the analysis
+#   + read the tables under the parser lock while a LexJob lexes
 
 
 import wx
-import os
-import tempfile
+import wx.stc as stc
 import sys
+import time
+import threading
 from LuaLexParser import LuaLexParser
+from LexBinary import DumpBinary
 from KeywordFrame import ListFrame
 from LuaSTC import LuaSTC
+from TokenList import TokenListCtrl, ErrorListCtrl
+
+
+class LexJob(threading.Thread):
+    '''Run a lexical analysis on a worker thread.
+
+    Results are posted back to the GUI thread in batches:
+        wx.CallAfter(frame.OnLexBatch, job, start, stop, pos, total)
+    The batch is token_descs[start:stop] of the parser, 'pos' is the
+    offset of its last token and 'total' the size of the source.
+    When the job finishes, it posts:
+        wx.CallAfter(frame.OnLexDone, job, cancelled)
+
+    [Note]:
+    -The frame must ignore calls from a job that is no longer its
+     current one, they are stale results.
+    -The job lexes with Lex(shared = True), the GUI thread must hold
+     parser.lock while it reads the tables of the parser.
+    '''
+
+    # Tokens lexed between two checks for cancellation
+    BATCH = 2048
+
+    def __init__(self, frame, parser):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.frame = frame
+        self.parser = parser
+        self.cancelled = threading.Event()
+
+        # When run() started, for the tokens/s readout
+        self.started = None
+
+
+    def Cancel(self):
+        '''Ask the job to stop after the current batch.'''
+        self.cancelled.set()
+
+
+    def run(self):
+        self.started = time.time()
+        parser = self.parser
+        total = len(parser.stream.buf)
+        start = 0
+        more = True
+        try:
+            while not self.cancelled.isSet():
+                # A parser kept from the last analysis has lexed its
+                # source already, its tokens are only posted then
+                stop = start + self.BATCH
+                if more:
+                    more = parser.Lex(stop, shared = True)
+                stop = min(stop, len(parser.token_descs))
+                if stop > start:
+                    pos = parser.token_descs.offsets[stop - 1]
+                    wx.CallAfter(self.frame.OnLexBatch, self, start, stop,
+                                 pos, total)
+                    start = stop
+                elif not more:
+                    break
+        finally:
+            wx.CallAfter(self.frame.OnLexDone, self,
+                         self.cancelled.isSet())
+
 
 
 class LexFrame(wx.Frame):
@@ -29,13 +111,24 @@ class LexFrame(wx.Frame):
     ID_LEX_ABOUT = 1006
     ID_LEX_TOKENS = 1007
     ID_LEX_ERRORS = 1008
+    ID_LEX_CANCEL = 1009
+    ID_LEX_SEL_LINES = 1010
 
     def __init__(
         self, parent, title, ID = -1, pos = wx.DefaultPosition,
         size = wx.DefaultSize, style = wx.DEFAULT_FRAME_STYLE):
 
+        # GetTokenInfo() tuples of the analyzed tokens, a TokenInfoView
+        # of the parser, resolved only when read
         self.sym_table = []
 
+        # Parser of the last analysis, kept up to date with every edit
+        # of the source by LuaLexParser.Relex()
+        self.parser = None
+
+        # Running LexJob, None if there is no analysis going on
+        self.job = None
+
         wx.Frame.__init__(self, parent, ID, title, pos, size, style)
 
         icon = wx.Icon('./res/app.ico', type = wx.BITMAP_TYPE_ICO )
@@ -62,15 +155,26 @@ class LexFrame(wx.Frame):
         toolbar.AddSeparator()
         toolbar.AddLabelTool(self.ID_LEX_ANALYZE, 'Analyze', analyze_bmp,
                              shortHelp = 'Start lexical analysis')
+        cancel_bmp = wx.ArtProvider_GetBitmap(wx.ART_CROSS_MARK,
+                                              wx.ART_TOOLBAR, tb_size)
+        toolbar.AddLabelTool(self.ID_LEX_CANCEL, 'Cancel', cancel_bmp,
+                             shortHelp = 'Stop lexical analysis')
+        self.progress = wx.Gauge(toolbar, -1, 100, size = (120, -1))
+        toolbar.AddControl(self.progress)
         toolbar.AddSeparator()
         toolbar.AddLabelTool(self.ID_LEX_KEYWORDS, 'Keywords', keyword_bmp,
                              shortHelp = 'Show keywords')
         toolbar.AddSeparator()
 
-        filter_list = [('Unfiltered', 'All'), ('Keywords', 'KEYWORDS'),
-                       ('Operator', 'OPS'), ('Delimiters', 'DELIMITERS'),
-                       ('Errors', 3),('Constant', 'consts'),
-                       ('Strings', 'strings'),('Symbols', 'symbols')
+        # The token types shown by each filter, None for all
+        filter_list = [('Unfiltered', None), ('Keywords', ('KEYWORDS', )),
+                       ('Operator', ('OPS', )),
+                       ('Delimiters', ('DELIMITERS', )),
+                       ('Errors', ('err_descs', )),
+                       ('Constant', ('consts', )),
+                       ('Strings', ('strings', )),
+                       ('Symbols', ('symbols', )),
+                       ('Strings + Symbols', ('strings', 'symbols'))
                        ]
         cb = wx.ComboBox(
                 toolbar, self.ID_LEX_FILTER, value = 'All',
@@ -82,33 +186,31 @@ class LexFrame(wx.Frame):
         self.filter = cb
 
         toolbar.AddControl(cb)
+        self.sel_lines = wx.CheckBox(toolbar, self.ID_LEX_SEL_LINES,
+                                     'Selected lines')
+        toolbar.AddControl(self.sel_lines)
 
         toolbar.AddSeparator()
         toolbar.AddLabelTool(self.ID_LEX_ABOUT, 'About', about_bmp,
                              shortHelp = 'About Lua lexical parser')
 
         toolbar.Realize()
+        toolbar.EnableTool(self.ID_LEX_CANCEL, False)
+        self.toolbar = toolbar
+
+        # Tokens/s and elapsed time of the analysis
+        self.CreateStatusBar()
 
         # Add controls
         panel = wx.Panel(self, -1)
         sizer = wx.GridBagSizer(4, 4)
 
-        self.tokens = wx.ListCtrl(panel, self.ID_LEX_TOKENS,
-                                  style = wx.LC_REPORT | wx.LC_SINGLE_SEL)
-        self.tokens.InsertColumn(0, 'Id')
-        self.tokens.InsertColumn(1, 'Class')
-        self.tokens.InsertColumn(2, 'Index')
-        self.tokens.InsertColumn(3, 'Symbol')
-        self.tokens.InsertColumn(4, 'Line number')
-        for i in range(5):
-            self.tokens.SetColumnWidth(i, wx.LIST_AUTOSIZE_USEHEADER)
+        self.tokens = TokenListCtrl(panel, self.ID_LEX_TOKENS)
 
         self.src = LuaSTC(panel, -1)
         font = wx.Font(10, wx.MODERN, wx.NORMAL, wx.NORMAL, False)
         self.src.SetFont(font)
-        self.error = wx.ListCtrl(panel, self.ID_LEX_ERRORS, size = (-1, -1),
-                            style = wx.LC_REPORT | wx.LC_SINGLE_SEL)
-        self.error.InsertColumn(0, 'Result')
+        self.error = ErrorListCtrl(panel, self.ID_LEX_ERRORS)
 
         sizer.Add(self.tokens, (0, 0), (4, 1),
                   flag = wx.TOP | wx.LEFT | wx.BOTTOM | wx.EXPAND,
@@ -129,12 +231,18 @@ class LexFrame(wx.Frame):
         self.Bind(wx.EVT_TOOL, self.OnOpenLuaFile, id = self.ID_LEX_OPEN_FILE)
         self.Bind(wx.EVT_TOOL, self.OnSaveResult, id = self.ID_LEX_SAVE_RESULT)
         self.Bind(wx.EVT_TOOL, self.OnLexAnalyze, id = self.ID_LEX_ANALYZE)
+        self.Bind(wx.EVT_TOOL, self.OnLexCancel, id = self.ID_LEX_CANCEL)
         self.Bind(wx.EVT_TOOL, self.OnPopupKeywords, id = self.ID_LEX_KEYWORDS)
         self.Bind(wx.EVT_COMBOBOX, self.OnTokenFilter, id = self.ID_LEX_FILTER)
+        self.Bind(wx.EVT_CHECKBOX, self.OnTokenFilter, id = self.ID_LEX_SEL_LINES)
         self.Bind(wx.EVT_TOOL, self.OnAbout, id = self.ID_LEX_ABOUT)
 
         self.tokens.Bind(wx.EVT_LEFT_DCLICK, self.OnTokensDoubleClick)
         self.error.Bind(wx.EVT_LEFT_DCLICK, self.OnErrorDoubleClick)
+        # Styling changes the text too, only edits are of interest
+        self.src.SetModEventMask(stc.STC_MOD_INSERTTEXT |
+                                 stc.STC_MOD_DELETETEXT)
+        self.src.Bind(stc.EVT_STC_MODIFIED, self.OnSourceModified)
 
         self.Bind(wx.EVT_CLOSE, self.OnCloseWindow)
 
@@ -142,7 +250,9 @@ class LexFrame(wx.Frame):
     def OnCloseWindow(self, event):
         '''Do some cleaning up before we exit.
         '''
-        # TODO
+        if self.job:
+            self.job.Cancel()
+            self.job = None
         self.Destroy()
 
     def OnOpenLuaFile(self, event):
@@ -152,17 +262,33 @@ class LexFrame(wx.Frame):
         dlg = wx.FileDialog(self, 'Choose a Lua source file', dirname,
                             '', 'Lua Source File(*.Lua)|*.Lua', wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
         if dlg.ShowModal() == wx.ID_OK:
+              # A new source needs a full analysis
+              self.parser = None
               self.src.LoadFile(dlg.GetPath())
         dlg.Destroy()
 
 
     def OnSaveResult(self, event):
         '''Save lexical analysis result to a file.
+
+        Token files(*.ltok) are written in the binary format of LexBinary.
         '''
-        dlg = wx.FileDialog(self, 'Save result to...', '', '', 'Text Files(*.txt)|*.txt|All Files(*.*)|*.*',
+        if self.job:
+            # The running analysis still writes the tables
+            wx.MessageBox('Please finish the analysis first.', 'Save result',
+                          wx.OK | wx.ICON_INFORMATION, self)
+            return
+
+        dlg = wx.FileDialog(self, 'Save result to...', '', '', 'Text Files(*.txt)|*.txt|'
+                            'Token Files(*.ltok)|*.ltok|All Files(*.*)|*.*',
                             wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
         if dlg.ShowModal() == wx.ID_OK:
             fullpath = dlg.GetPath()
+            if dlg.GetFilterIndex() == 1 or fullpath.lower().endswith('.ltok'):
+                self.__SaveBinary(fullpath)
+                dlg.Destroy()
+                return
+
             # Open the file and write result to it
             f = open(fullpath, 'w')
             f.write('idx, (type_id[type_name], sym_idx): "sym_value", line\n\n')
@@ -174,7 +300,7 @@ class LexFrame(wx.Frame):
                 idx += 1
 
             # Write summary
-            err_count = self.error.GetItemCount()
+            err_count = len(self.error.rows)
             sym_count = len(self.sym_table) - err_count
             s = '\n%d symbol(s) found.\n%d error(s) found.\n' % (sym_count, err_count)
             f.write(s)
@@ -184,87 +310,182 @@ class LexFrame(wx.Frame):
         dlg.Destroy()
 
 
+    def __SaveBinary(self, fullpath):
+        '''Save the tokens of the finished analysis to a token file.
+        '''
+        if self.parser is None or self.job:
+            wx.MessageBox('Please finish the analysis first.', 'Save result',
+                          wx.OK | wx.ICON_INFORMATION, self)
+            return
+
+        f = open(fullpath, 'wb')
+        try:
+            DumpBinary(self.parser, f)
+        finally:
+            f.close()
+
+
+    def OnSourceModified(self, event):
+        '''Handles the source edit control modification event.
+
+        Re-lex the edited part of the source, if it was analyzed before.
+        '''
+        event.Skip()
+        mod = event.GetModificationType()
+        if mod & stc.STC_MOD_INSERTTEXT:
+            removed, added = 0, event.GetLength()
+        elif mod & stc.STC_MOD_DELETETEXT:
+            removed, added = event.GetLength(), 0
+        else:
+            return
+
+        if self.job:
+            # The running analysis lexes the text before this edit
+            self.job.Cancel()
+            if self.job.parser is self.parser:
+                # Do not re-lex under the worker, it stops after a batch
+                self.job.join()
+        if self.parser is None:
+            return
+
+        start, stop, old_stop = self.parser.Relex(self.src.GetTextRaw(),
+                                                  event.GetPosition(),
+                                                  removed, added)
+        if self.job is None and self.tokens.parser is self.parser:
+            # Keep the results of the last analysis in sync, sym_table
+            # follows the token table by itself
+            self.tokens.Splice(start, stop, old_stop)
+            self.error.Splice(start, stop, old_stop)
+            self.__UpdateSummary()
+
+
     def OnLexAnalyze(self, event):
-        '''Start lexical analysis.
+        '''Start lexical analysis on a worker thread.
+
+        A running analysis is cancelled, results come in batches to
+        OnLexBatch().
         '''
-        # Get a tmp file name
-        tmpfile = tempfile.NamedTemporaryFile(suffix = 'lxa', delete = False)
-        tmpname = tmpfile.name
-        tmpfile.close()
-        self.src.SaveFile(tmpname)
-        # Append a '\n', thus omitting some special handling while parsing
-        f = open(tmpname, 'a')
-        f.write('\n')
-        f.close()
-
-        # Parse file and build a symbol table
-        parser = LuaLexParser(tmpname)
-        token = parser.GetToken()
-        self.sym_table = []
-        while token:
-            if not parser.IsCommentToken(token):
-                info = parser.GetTokenInfo(token)
-                self.sym_table.append(info)
-            token = parser.GetToken()
-
-        # Delete tmp file
-        os.remove(tmpname)
-
-        # Add to our ListCtrls
-        self.tokens.DeleteAllItems()
-        self.error.DeleteAllItems()
-        item_idx = 0
-        sym_filter = self.filter.GetClientData(self.filter.GetSelection())
-
-        for type_id, type_name, sym_idx, sym_value, line in self.sym_table:
-            # Dirty trick to handle error messages
-            name = type_name
-            if type_id == 3:
-                name = 3
-
-            # Update items in the listctrl
-            if sym_filter == 'All' or sym_filter == name:
-                item_idx = self.tokens.InsertStringItem(sys.maxint, str(item_idx + 1))
-                self.tokens.SetStringItem(item_idx, 1, '%d(%s)' % (type_id, type_name))
-                self.tokens.SetStringItem(item_idx, 2, str(sym_idx))
-                self.tokens.SetStringItem(item_idx, 3, str(sym_value))
-                self.tokens.SetStringItem(item_idx, 4, str(line))
-
-                if parser.IsErrorTypeId(type_id):
-                    # Mark errors with red color
-                    item = self.tokens.GetItem(item_idx)
-                    item.SetTextColour(wx.RED)
-                    self.tokens.SetItem(item)
-
-                # Next item
-                item_idx += 1
-
-            # Insert into error list
-            if parser.IsErrorTypeId(type_id):
-                index = self.error.InsertStringItem(sys.maxint,
-                            'Line[%d] : "%s" : error %d: %s' % \
-                            (line, sym_value, sym_idx, type_name))
-                item = self.error.GetItem(index)
-                item.SetTextColour(wx.RED)
-                self.error.SetItem(item)
-
-        err_count = self.error.GetItemCount()
+        if self.job:
+            self.job.Cancel()
+
+        # Edits since the last analysis are already lexed by
+        # OnSourceModified(), a kept parser only needs its tokens resolved
+        parser = self.parser
+        if parser is None:
+            # Parse the raw text without decoding it, so that positions
+            # in the source edit control are offsets in the parser source
+            parser = LuaLexParser(source = self.src.GetTextRaw(),
+                                  decode = False)
+
+        self.sym_table = parser.GetTokenInfoView(0, 0)
+        self.tokens.SetParser(parser)
+        self.tokens.SetFilter(*self.__GetFilter())
+        self.error.SetParser(parser)
+        self.error.SetFooter([])
+        self.progress.SetValue(0)
+        self.toolbar.EnableTool(self.ID_LEX_CANCEL, True)
+
+        self.job = LexJob(self, parser)
+        self.job.start()
+
+
+    def OnLexCancel(self, event):
+        '''Stop the running analysis.
+        '''
+        if self.job:
+            self.job.Cancel()
+
+
+    def OnLexBatch(self, job, start, stop, pos, total):
+        '''Add a batch of analysis results to our ListCtrls.
+
+        Called on the GUI thread by LexJob.
+        '''
+        if job is not self.job:
+            # Stale results of a cancelled analysis
+            return
+
+        self.sym_table = job.parser.GetTokenInfoView(0, stop)
+        self.tokens.AddRange(start, stop)
+        self.error.AddRange(start, stop)
+        if total > 0:
+            self.progress.SetValue(pos * 100 // total)
+        self.__ShowRate(job, 'Analyzing')
+
+
+    def OnLexDone(self, job, cancelled):
+        '''Finish the analysis, called on the GUI thread by LexJob.
+        '''
+        if job is not self.job:
+            # Stale results of a cancelled analysis
+            return
+
+        self.job = None
+        self.toolbar.EnableTool(self.ID_LEX_CANCEL, False)
+        if cancelled:
+            self.sym_table = []
+            self.tokens.SetParser(None)
+            self.error.SetParser(None)
+            self.error.SetFooter(['Analysis cancelled.'])
+            self.error.AutoSizeColumns()
+            self.progress.SetValue(0)
+            self.SetStatusText('Analysis cancelled.')
+            return
+
+        # Keep the parser for incremental re-lexing
+        self.parser = job.parser
+        self.sym_table = self.parser.GetTokenInfoView()
+        self.progress.SetValue(100)
+        self.__ShowRate(job, 'Done')
+
+        self.__UpdateSummary()
+        self.tokens.AutoSizeColumns()
+        self.error.AutoSizeColumns()
+
+
+    def __ShowRate(self, job, state):
+        '''Show the tokens, elapsed time and tokens/s of job in the
+        status bar.
+        '''
+        count = len(self.sym_table)
+        elapsed = max(time.time() - job.started, 1e-6)
+        self.SetStatusText('%s: %d token(s) in %.2fs, %.0f tokens/s'
+                           % (state, count, elapsed, count / elapsed))
+
+
+    def __UpdateSummary(self):
+        '''Show the symbol and error counts after the errors.
+        '''
+        err_count = len(self.error.rows)
         sym_count = len(self.sym_table) - err_count
+        summary = []
         if err_count > 0:
-            self.error.InsertStringItem(sys.maxint, '')
-        self.error.InsertStringItem(sys.maxint, '%d symbol(s) found.' % sym_count)
-        self.error.InsertStringItem(sys.maxint, '%d error(s) found.' % err_count)
+            summary.append('')
+        summary.append('%d symbol(s) found.' % sym_count)
+        summary.append('%d error(s) found.' % err_count)
+        self.error.SetFooter(summary)
 
-        self.tokens.SetColumnWidth(0, wx.LIST_AUTOSIZE)
-        self.tokens.SetColumnWidth(1, wx.LIST_AUTOSIZE)
-        self.tokens.SetColumnWidth(2, wx.LIST_AUTOSIZE_USEHEADER)
-        self.tokens.SetColumnWidth(3, wx.LIST_AUTOSIZE)
-        self.tokens.SetColumnWidth(4, wx.LIST_AUTOSIZE_USEHEADER)
 
-        self.error.SetColumnWidth(0, wx.LIST_AUTOSIZE)
+    def __GetFilter(self):
+        '''Return the (types, lines) filter of the token list.
+
+        -types is the set of token types chosen in the filter box.
+        -lines is the (first, last) range of the selected lines, if only
+         tokens on those lines are to be shown.
+        Either is None if it does not filter anything.
+        '''
+        types = None
+        names = self.filter.GetClientData(self.filter.GetSelection())
+        if names:
+            types = set([LuaLexParser.TOKENTYPE.index(n) for n in names])
+
+        lines = None
+        if self.sel_lines.GetValue():
+            start, end = self.src.GetSelection()
+            lines = (self.src.LineFromPosition(start) + 1,
+                     self.src.LineFromPosition(end) + 1)
+        return (types, lines)
 
-        # Delete the parser
-        del parser
 
     def OnPopupKeywords(self, event):
         '''Show keywords and other reserved characters in a popup dialog.
@@ -276,40 +497,11 @@ class LexFrame(wx.Frame):
     def OnTokenFilter(self, event):
         '''Filter lexical analysis results.
         '''
-        cb = event.GetEventObject()
-        data = cb.GetClientData(cb.GetSelection())
-        if not self.sym_table:
+        if self.tokens.parser is None:
             return
 
-        self.tokens.DeleteAllItems()
-        item_idx = 0
-        for type_id, type_name, sym_idx, sym_value, line in self.sym_table:
-            # Dirty trick to handle error messages
-            name = type_name
-            if type_id == 3:
-                name = 3
-
-            # Update items in the listctrl
-            if data == 'All' or name == data:
-                self.tokens.InsertStringItem(item_idx, str(item_idx + 1))
-                self.tokens.SetStringItem(item_idx, 1, '%d(%s)' % (type_id, type_name))
-                self.tokens.SetStringItem(item_idx, 2, str(sym_idx))
-                self.tokens.SetStringItem(item_idx, 3, str(sym_value))
-                self.tokens.SetStringItem(item_idx, 4, str(line))
-
-                if type_id == 3:
-                    # Mark errors with red color
-                    item = self.tokens.GetItem(item_idx)
-                    item.SetTextColour(wx.RED)
-                    self.tokens.SetItem(item)
-
-                item_idx += 1
-
-        self.tokens.SetColumnWidth(0, wx.LIST_AUTOSIZE)
-        self.tokens.SetColumnWidth(1, wx.LIST_AUTOSIZE)
-        self.tokens.SetColumnWidth(2, wx.LIST_AUTOSIZE_USEHEADER)
-        self.tokens.SetColumnWidth(3, wx.LIST_AUTOSIZE)
-        self.tokens.SetColumnWidth(4, wx.LIST_AUTOSIZE_USEHEADER)
+        self.tokens.SetFilter(*self.__GetFilter())
+        self.tokens.AutoSizeColumns()
 
 
     def OnAbout(self, event):
@@ -330,35 +522,30 @@ GUI Powered by wxPython.'''
     def OnTokensDoubleClick(self, event):
         '''Handles the tokens listctrl double click event.
 
-        Goto the token line.
+        Select the token in the source.
         '''
         ctrl = event.GetEventObject()
         idx = ctrl.GetNextItem(-1, state = wx.LIST_STATE_SELECTED)
         if idx != -1:
-            item = ctrl.GetItem(idx, 4)
-            line = int(item.GetText())
-            self.GotoLine(self.src, line)
+            start, end = ctrl.GetRowSpan(idx)
+            self.GotoSpan(self.src, start, end)
 
 
     def OnErrorDoubleClick(self, event):
         '''Handles error listctrl double click event.
 
-        Goto the error line
+        Select the error in the source.
         '''
         ctrl = event.GetEventObject()
         idx = ctrl.GetNextItem(-1, state = wx.LIST_STATE_SELECTED)
         if idx != -1:
-            item = ctrl.GetItem(idx, 0)
-            s = item.GetText()
-            a = s.find('[') + 1
-            b = s.find(']')
+            span = ctrl.GetRowSpan(idx)
 
-            # Not found
-            if a >= b:
+            # Not an error, e.g. the summary
+            if span is None:
                 return
 
-            line = int(s[a:b])
-            self.GotoLine(self.src, line)
+            self.GotoSpan(self.src, span[0], span[1])
 
 
 
@@ -374,15 +561,27 @@ GUI Powered by wxPython.'''
         if line >= lines:
             return
 
-        pos = 0
-        for i in range(0, line - 1):
-            pos += len(ctrl.GetLine(i))
-
-        ctrl.SetSelection(pos, pos + len(ctrl.GetLine(line - 1)) - 1)
+        # The control keeps a line start table, no need to sum lines
+        pos = ctrl.PositionFromLine(line - 1)
+        ctrl.SetSelection(pos, ctrl.GetLineEndPosition(line - 1))
         ctrl.SetFocus()
 	ctrl.ScrollToLine((line - 5 and [line - 5] or [line - 1])[0])
 
 
+    def GotoSpan(self, ctrl, start, end):
+        '''Select the offsets [start, end) in a StyledTextCtrl.
+
+        Offsets are the ones of the parser source, i.e. GetTextRaw().
+        '''
+        if ctrl == None:
+            return
+
+        ctrl.SetSelection(start, end)
+        ctrl.SetFocus()
+        line = ctrl.LineFromPosition(start) + 1
+        ctrl.ScrollToLine((line - 5 and [line - 5] or [line - 1])[0])
+
+
 if __name__ == '__main__':
     app = wx.App(False)
 
@@ -0,0 +1,339 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexIndex.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, a persistent project wide symbol index.
+
+'''Where is a symbol used?
+
+usage: LexIndex.py INDEX update [-j JOBS] [-p PATTERN] PATH [PATH ...]
+       LexIndex.py INDEX find NAME [NAME ...]
+
+"update" brings INDEX up to date with the Lua files found in PATHs, see
+LexBatch.FindSources(). Only new and changed files are lexed, files no
+longer found are dropped from the index. "find" prints each use of
+NAME as "path:line: offset".
+'''
+
+import os
+import sys
+import array
+import sqlite3
+import hashlib
+import argparse
+import multiprocessing
+
+from LuaLexParser import LuaLexParser
+from LexBatch import FindSources
+
+
+def _Pack(values):
+    '''Return an array('i') as little-endian bytes.'''
+    if sys.byteorder != 'little':
+        values = array.array('i', values)
+        values.byteswap()
+    return values.tostring()
+
+
+def _Unpack(data):
+    '''Return the array('i') of _Pack() bytes.'''
+    values = array.array('i', str(data))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _Digest(path):
+    '''Return a hash of the content of a file, None if it can not be
+    read.
+    '''
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        return hashlib.sha1(f.read()).hexdigest()
+    finally:
+        f.close()
+
+
+def _Name(name):
+    '''Return a symbol as it is stored in the index.'''
+    if isinstance(name, unicode):
+        return name.encode('utf-8')
+    return name
+
+
+def _IndexFile(job):
+    '''Worker: lex one file and collect the uses of its symbols.
+
+    -job is (path, engine).
+    -Return (path, digest, postings). digest is the hash of what was
+     lexed, see _Digest(). postings is a list of (symbol, lines,
+     offsets), lines and offsets are _Pack() arrays.
+    '''
+    path, engine = job
+    try:
+        f = open(path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    except IOError:
+        data = ''
+
+    lex = LuaLexParser(source = data, engine = engine)
+    lex.Lex()
+
+    tokens = lex.token_descs
+    uses = {}
+    for seq in tokens.Positions(LuaLexParser.TYPE_SYMBOLS):
+        index = tokens.indexes[seq]
+        use = uses.get(index)
+        if use is None:
+            use = uses[index] = (array.array('i'), array.array('i'))
+        use[0].append(tokens.lines[seq])
+        use[1].append(tokens.offsets[seq])
+
+    postings = [(_Name(lex.symbols[index]), _Pack(lines), _Pack(offsets))
+                for index, (lines, offsets) in uses.iteritems()]
+    return (path, hashlib.sha1(data).hexdigest(), postings)
+
+
+
+class SymbolIndex(object):
+    '''A persistent inverted index: symbol -> uses in a source tree.
+
+    The index is an SQLite database. Each file keeps its mtime, size
+    and content hash, so Update() lexes a file again only if its
+    content changed. The uses of a symbol in one file are one row,
+    their lines and offsets packed into two arrays, so a lookup is one
+    index seek per file using the symbol.
+
+    Offsets count characters of the decoded source, like the 'offset'
+    of a token. Symbols are stored UTF-8 encoded.
+    '''
+
+    # Bump it whenever the layout of the database changes
+    FORMAT = 1
+
+    VERSION = (FORMAT << 16) | LuaLexParser.LEXER_VERSION
+
+    SCHEMA = '''
+        CREATE TABLE files (id INTEGER PRIMARY KEY, path TEXT UNIQUE,
+                            mtime REAL, size INTEGER, digest TEXT);
+        CREATE TABLE symbols (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+        CREATE TABLE postings (symbol INTEGER, file INTEGER,
+                               lines BLOB, offsets BLOB,
+                               PRIMARY KEY (symbol, file));
+        CREATE INDEX postings_file ON postings (file);
+        '''
+
+    def __init__(self, filename):
+        self.db = sqlite3.connect(filename)
+        self.db.text_factory = str
+
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.VERSION:
+            # Made by another format or lexer, start over
+            self.db.executescript('''
+                DROP TABLE IF EXISTS postings;
+                DROP TABLE IF EXISTS symbols;
+                DROP TABLE IF EXISTS files;
+                ''' + self.SCHEMA)
+            self.db.execute('PRAGMA user_version = %d' % self.VERSION)
+            self.db.commit()
+
+
+    def Close(self):
+        self.db.close()
+
+
+    def Update(self, sources, jobs = None, engine = 'regex'):
+        '''Bring the index up to date with sources.
+
+        -sources is a list returned by LexBatch.FindSources(), it is the
+         whole tree: indexed files not in it are removed.
+        -jobs is the number of processes lexing files, None for the CPU
+         count.
+        -Return (lexed, removed, unchanged) numbers of files.
+        '''
+        db = self.db
+        known = {}
+        for file_id, path, mtime, size, digest in db.execute(
+                'SELECT id, path, mtime, size, digest FROM files'):
+            known[path] = (file_id, mtime, size, digest)
+
+        work = []
+        stats = {}
+        unchanged = 0
+        for path, name in sources:
+            if path in stats:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = (st.st_mtime, st.st_size)
+            entry = known.pop(path, None)
+            if entry is not None:
+                file_id, mtime, size, digest = entry
+                if (mtime, size) == stats[path]:
+                    unchanged += 1
+                    continue
+                if size == st.st_size and _Digest(path) == digest:
+                    # Touched, but the content is the same
+                    db.execute('UPDATE files SET mtime = ? WHERE id = ?',
+                               (st.st_mtime, file_id))
+                    unchanged += 1
+                    continue
+            work.append((path, engine))
+
+        for file_id, mtime, size, digest in known.itervalues():
+            self.__Remove(file_id)
+
+        lexed = 0
+        symbol_ids = {}
+        for path, digest, postings in _RunJobs(work, jobs):
+            mtime, size = stats[path]
+            row = db.execute('SELECT id FROM files WHERE path = ?',
+                             (path,)).fetchone()
+            if row is not None:
+                file_id = row[0]
+                db.execute('DELETE FROM postings WHERE file = ?', (file_id,))
+                db.execute('UPDATE files SET mtime = ?, size = ?, '
+                           'digest = ? WHERE id = ?',
+                           (mtime, size, digest, file_id))
+            else:
+                file_id = db.execute(
+                    'INSERT INTO files (path, mtime, size, digest) '
+                    'VALUES (?, ?, ?, ?)', (path, mtime, size, digest)
+                    ).lastrowid
+            db.executemany(
+                'INSERT INTO postings (symbol, file, lines, offsets) '
+                'VALUES (?, ?, ?, ?)',
+                [(self.__SymbolId(name, symbol_ids), file_id, buffer(lines),
+                  buffer(offsets)) for name, lines, offsets in postings])
+            lexed += 1
+
+        if known or lexed:
+            db.execute('DELETE FROM symbols WHERE id NOT IN '
+                       '(SELECT symbol FROM postings)')
+        db.commit()
+        return (lexed, len(known), unchanged)
+
+
+    def __Remove(self, file_id):
+        self.db.execute('DELETE FROM postings WHERE file = ?', (file_id,))
+        self.db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+
+    def __SymbolId(self, name, symbol_ids):
+        '''Return the id of a symbol, add it if it is new.
+
+        -symbol_ids caches the ids looked up during one Update().
+        '''
+        symbol_id = symbol_ids.get(name)
+        if symbol_id is None:
+            row = self.db.execute('SELECT id FROM symbols WHERE name = ?',
+                                  (name,)).fetchone()
+            if row is not None:
+                symbol_id = row[0]
+            else:
+                symbol_id = self.db.execute(
+                    'INSERT INTO symbols (name) VALUES (?)',
+                    (name,)).lastrowid
+            symbol_ids[name] = symbol_id
+        return symbol_id
+
+
+    def __Postings(self, name):
+        return self.db.execute(
+            'SELECT files.path, postings.lines, postings.offsets '
+            'FROM symbols JOIN postings ON postings.symbol = symbols.id '
+            'JOIN files ON files.id = postings.file '
+            'WHERE symbols.name = ? ORDER BY files.path', (_Name(name),))
+
+
+    def Find(self, name):
+        '''Return the uses of a symbol, a list of (path, line, offset)
+        sorted by path and offset.
+        '''
+        found = []
+        for path, lines, offsets in self.__Postings(name):
+            found.extend([(path, line, offset) for line, offset in
+                          zip(_Unpack(lines), _Unpack(offsets))])
+        return found
+
+
+    def Count(self, name):
+        '''Return a list of (path, number of uses) of a symbol.'''
+        return [(path, len(lines) // 4)
+                for path, lines, offsets in self.__Postings(name)]
+
+
+    def Files(self):
+        '''Return the paths of the indexed files.'''
+        return [row[0] for row in
+                self.db.execute('SELECT path FROM files ORDER BY path')]
+
+
+def _RunJobs(work, jobs):
+    '''Yield _IndexFile() results of work, in any order.'''
+    if jobs == 1 or len(work) < 2:
+        for job in work:
+            yield _IndexFile(job)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        chunksize = max(1, min(64, len(work) // ((jobs or 1) * 8)))
+        for result in pool.imap_unordered(_IndexFile, work, chunksize):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def __main():
+    parser = argparse.ArgumentParser(
+        description = 'Index the symbols of Lua files.')
+    parser.add_argument('index', metavar = 'INDEX',
+                        help = 'the index database')
+    commands = parser.add_subparsers(dest = 'command')
+    update = commands.add_parser('update', help = 'update the index')
+    update.add_argument('paths', nargs = '+', metavar = 'PATH',
+                        help = 'a Lua file, a directory or a glob')
+    update.add_argument('-j', '--jobs', type = int, default = None,
+                        help = 'worker processes (default: CPU count)')
+    update.add_argument('-p', '--pattern', default = '*.lua',
+                        help = 'file pattern searched in directories')
+    update.add_argument('-e', '--engine', default = 'regex',
+                        choices = LuaLexParser.ENGINES)
+    find = commands.add_parser('find', help = 'print the uses of symbols')
+    find.add_argument('names', nargs = '+', metavar = 'NAME')
+    args = parser.parse_args()
+
+    index = SymbolIndex(args.index)
+    try:
+        if args.command == 'update':
+            sources = FindSources(args.paths, args.pattern)
+            lexed, removed, unchanged = index.Update(sources, args.jobs,
+                                                     args.engine)
+            sys.stderr.write('%d lexed, %d removed, %d unchanged\n'
+                             % (lexed, removed, unchanged))
+        else:
+            for name in args.names:
+                for path, line, offset in index.Find(name):
+                    sys.stdout.write('%s:%d: %d\n' % (path, line, offset))
+    finally:
+        index.Close()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    __main()
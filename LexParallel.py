@@ -0,0 +1,253 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexParallel.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, lexes one source on several processes.
+#   + no more processes than CPUs, lex in this process on one CPU.
+
+'''Lex one big source on several processes.
+
+The source is cut at line starts into chunks, each chunk is lexed by its
+own LuaLexParser in a worker process, then the tables of the chunks are
+merged into one parser. That parser replays the tokens like a parser
+loaded from a LexCache.TokenCache, GetToken() returns exactly what a
+parser lexing the whole source returns.
+
+Only long brackets and line strings with escaped linefeeds span lines,
+so a line start is a safe cut if none of them is open there. FindSplits()
+looks for such line starts by a pre-scan that skips strings and comments
+only. It is cheap but does not see the other tokens, so each cut is also
+proven by the lexer itself: the chunk in front of it must end with a
+checkpoint, i.e. at a line start outside of any token. If it does not,
+the rest of the source is lexed in one piece.
+'''
+
+import re
+import multiprocessing
+
+from LuaLexParser import LuaLexParser
+from LexTables import InternTable, ConstTable, TokenTable, CheckpointTable
+
+
+# Sources smaller than this are not worth the processes
+MIN_SIZE = 1 << 20
+
+# Chunks per process, smaller chunks even out the load
+CHUNKS_PER_JOB = 4
+
+# Openings of the lexemes the pre-scan skips
+SCAN_RE = re.compile(r'''--\[(=*)\[|--[^\n]*|\[(=*)\[|(["'])''')
+
+
+def _SkipOver(buf, m):
+    '''Return the end of the lexeme opened by m, a match of SCAN_RE.'''
+    level = m.group(1)
+    if level is None:
+        level = m.group(2)
+    if level is not None:
+        close = buf.find(']' + level + ']', m.end())
+        if close < 0:
+            return len(buf)
+        return close + len(level) + 2
+
+    quote = m.group(3)
+    if quote is None:
+        # Line comment
+        return m.end()
+    end = LuaLexParser.LINE_STRING_RE[quote].match(buf, m.end()).end()
+    if buf[end:end + 1] == quote:
+        end += 1
+    return end
+
+
+def FindSplits(buf, targets):
+    '''Find where to cut buf into chunks.
+
+    -targets are positions in increasing order.
+    -Return a list of cuts in increasing order, at most one for each
+     target: the first line start at or after the target which is not
+     inside a long bracket, a string or a comment.
+    '''
+    splits = []
+    targets = iter(targets)
+    target = next(targets, None)
+
+    # Nothing is open in buf[pos:start]
+    pos = 0
+    while target is not None:
+        m = SCAN_RE.search(buf, pos)
+        if m is None:
+            start = len(buf)
+        else:
+            start = m.start()
+        while target is not None:
+            first = max(target, pos + 1)
+            if splits:
+                first = max(first, splits[-1] + 1)
+            nl = buf.find('\n', first - 1, start)
+            if nl < 0:
+                break
+            if nl + 1 < len(buf):
+                splits.append(nl + 1)
+            target = next(targets, None)
+        if m is None:
+            break
+        pos = _SkipOver(buf, m)
+    return splits
+
+
+def _LexChunk(job):
+    '''Worker: lex one chunk of a source.
+
+    -job is (text, engine), text is already decoded.
+    -Return the GetState() of the chunk.
+    '''
+    text, engine = job
+    lex = LuaLexParser(source = text, engine = engine, decode = False)
+    lex.Lex()
+    return lex.GetState()
+
+
+
+class _Merger(object):
+    '''Joins the GetState() of consecutive chunks into the GetState() of
+    the whole source.
+
+    Values are interned again in chunk order, which is the order the
+    whole source would intern them in, and the indexes of the tokens
+    are mapped to the merged tables. Lines, offsets and seqs are moved
+    by what the chunks in front hold.
+    '''
+
+    def __init__(self):
+        self.tokens = TokenTable()
+        self.comments = TokenTable()
+        self.checkpoints = CheckpointTable()
+        self.consts = ConstTable()
+        self.strings = InternTable()
+        self.symbols = InternTable()
+        self.errors = InternTable()
+
+        # Where the next chunk starts
+        self.offset = 0
+        self.linenum = 1
+        self.line_start = 0
+
+
+    def Add(self, state, size, last):
+        '''Append the state of the next chunk, which has size characters.
+
+        -Return False and add nothing if the chunk is not the last one and
+         does not end outside of any token, the cut behind it is wrong.
+        '''
+        (tokens, comments, checkpoints, consts, strings, symbols, errors,
+         linenum, line_start) = state
+        chunk_points = CheckpointTable()
+        chunk_points.Load(checkpoints)
+        if not last and (not len(chunk_points) or
+                         chunk_points.offsets[-1] != size):
+            return False
+
+        chunk_tokens = TokenTable()
+        chunk_tokens.Load(tokens)
+        chunk_comments = TokenTable()
+        chunk_comments.Load(comments)
+        chunk_consts = ConstTable()
+        chunk_consts.Load(consts)
+
+        maps = {
+            LuaLexParser.TYPE_CONSTS:
+                [self.consts.Intern(v) for v in chunk_consts],
+            LuaLexParser.TYPE_STRINGS:
+                [self.strings.Intern(s) for s in strings],
+            LuaLexParser.TYPE_SYMBOLS:
+                [self.symbols.Intern(s) for s in symbols],
+            LuaLexParser.TYPE_ERRORS:
+                [self.errors.Intern(tuple(err)) for err in errors],
+            }
+        indexes = chunk_tokens.indexes
+        for type_id, index_map in maps.iteritems():
+            if index_map == range(len(index_map)):
+                continue
+            for seq in chunk_tokens.Positions(type_id):
+                indexes[seq] = index_map[indexes[seq]]
+
+        # A blank run across the cut has one checkpoint, at its last line
+        # start. The chunk in front ends with one at the cut, drop it if
+        # this chunk has another one before its first token or comment.
+        points = self.checkpoints
+        first = [table.offsets[0] for table in (chunk_tokens, chunk_comments)
+                 if len(table)]
+        if (len(points) and points.offsets[-1] == self.offset and
+                len(chunk_points) and
+                chunk_points.offsets[0] <= min(first or [size])):
+            del points.offsets[-1], points.lines[-1], points.seqs[-1]
+
+        line_delta = self.linenum - 1
+        points.Extend(chunk_points, line_delta, self.offset,
+                      len(self.tokens))
+        self.tokens.Extend(chunk_tokens, line_delta, self.offset)
+        self.comments.Extend(chunk_comments, line_delta, self.offset)
+
+        self.linenum = linenum + line_delta
+        self.line_start = line_start + self.offset
+        self.offset += size
+        return True
+
+
+    def GetState(self):
+        '''Return the merged state, see LuaLexParser.GetState().'''
+        return (self.tokens.Dump(), self.comments.Dump(),
+                self.checkpoints.Dump(), self.consts.Dump(),
+                list(self.strings), list(self.symbols), list(self.errors),
+                self.linenum, self.line_start)
+
+
+
+def LexParallel(filename = None, engine = 'regex', source = None,
+                decode = True, jobs = None):
+    '''Lex a source on a pool of jobs processes.
+
+    -filename, engine, source and decode are the arguments of
+     LuaLexParser.
+    -jobs is the number of processes, None for the CPU count. More
+     processes than CPUs only add forks and pickling, so it is capped at
+     the CPU count.
+    -Return a LuaLexParser of the source. Its GetToken() replays the
+     merged tokens, comments included. Sources smaller than MIN_SIZE,
+     or lexed with one job, are left to the parser to lex as usual.
+    '''
+    lex = LuaLexParser(filename, engine = engine, source = source,
+                       decode = decode)
+    buf = lex.stream.buf
+    cpus = multiprocessing.cpu_count()
+    if jobs is None or jobs > cpus:
+        jobs = cpus
+    if jobs < 2 or len(buf) < MIN_SIZE:
+        return lex
+
+    count = jobs * CHUNKS_PER_JOB
+    splits = FindSplits(buf, [len(buf) * i // count
+                              for i in xrange(1, count)])
+    if not splits:
+        return lex
+    bounds = zip([0] + splits, splits + [len(buf)])
+
+    merger = _Merger()
+    pool = multiprocessing.Pool(jobs)
+    try:
+        states = pool.imap(_LexChunk, [(buf[start:end], engine)
+                                       for start, end in bounds])
+        for i, (start, end) in enumerate(bounds):
+            last = i == len(bounds) - 1
+            if not merger.Add(next(states), end - start, last):
+                merger.Add(_LexChunk((buf[start:], engine)),
+                           len(buf) - start, True)
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    lex.SetState(merger.GetState())
+    return lex
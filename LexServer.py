@@ -0,0 +1,474 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexServer.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, a local lexing service and its client.
+#   + send replies from the connection thread, share the job of
+#     concurrent requests for the same source.
+
+'''A long running lexing service.
+
+usage: LexServer.py [-j JOBS] [--cache-size MB] (-u PATH | -p PORT)
+
+The server listens on a Unix domain socket at PATH, or on localhost
+PORT, and lexes the sources its clients send on a process pool, so the
+clients pay neither the interpreter startup nor the import of the lexer.
+
+Every message is a frame: a FRAME header (body length, request id,
+code) followed by the body. The code of a request is an OP_* constant,
+the one of a reply a STATUS_* constant.
+
+OP_LEX      body: LEX_HEADER (engine index into LuaLexParser.ENGINES,
+            decode flag, key length), the key, then the source bytes.
+            Replied with STATUS_OK and a LexBinary token file, or with
+            STATUS_ERROR and a message.
+OP_CANCEL   empty body, cancels the request with the same id. Replied
+            with STATUS_CANCELLED unless the request was answered
+            already.
+
+A client may send requests without waiting for replies. Replies carry
+the id of their request and are sent as soon as they are ready, not in
+request order.
+
+Results are kept in a ResultCache. Its key is the key of the request,
+e.g. a path and a modification time, or a hash of the source if the
+key is empty, so repeated requests for the same version of a file are
+replied at once. A request for a key that is being lexed waits for
+that job instead of starting another one.
+'''
+
+import os
+import sys
+import socket
+import Queue
+import struct
+import hashlib
+import argparse
+import itertools
+import threading
+import collections
+import multiprocessing
+import SocketServer
+import cStringIO
+
+from LuaLexParser import LuaLexParser
+from LexBinary import DumpBinary, BinaryTokens
+
+
+FRAME = struct.Struct('<IIB')
+LEX_HEADER = struct.Struct('<BBH')
+
+OP_LEX = 1
+OP_CANCEL = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_CANCELLED = 2
+
+
+def _ReadExactly(sock, size):
+    '''Return size bytes read from sock, None at EOF.'''
+    chunks = []
+    while size:
+        data = sock.recv(min(size, 1 << 20))
+        if not data:
+            return None
+        chunks.append(data)
+        size -= len(data)
+    return ''.join(chunks)
+
+
+def _ReadFrame(sock):
+    '''Return (request_id, code, body) of the next frame, None at EOF.'''
+    header = _ReadExactly(sock, FRAME.size)
+    if header is None:
+        return None
+    size, request_id, code = FRAME.unpack(header)
+    body = _ReadExactly(sock, size)
+    if body is None:
+        return None
+    return (request_id, code, body)
+
+
+def _Frame(request_id, code, body = ''):
+    return FRAME.pack(len(body), request_id, code) + body
+
+
+def _LexSource(job):
+    '''Worker: lex one source.
+
+    -job is (source, engine, decode).
+    -Return (True, token file) or (False, error message). Exceptions
+     are caught here, the pool would not report them to a callback.
+    '''
+    source, engine, decode = job
+    try:
+        lex = LuaLexParser(source = source, engine = engine,
+                           decode = decode)
+        f = cStringIO.StringIO()
+        DumpBinary(lex, f)
+        return (True, f.getvalue())
+    except Exception as e:
+        return (False, '%s: %s' % (e.__class__.__name__, e))
+
+
+
+class ResultCache(object):
+    '''Token files of recent requests, least recently used ones are
+    dropped when they take more than max_bytes. Thread-safe.
+    '''
+
+    def __init__(self, max_bytes = 64 << 20):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def Get(self, key):
+        '''Return the data stored under key, None if there is none.'''
+        with self.lock:
+            data = self.entries.pop(key, None)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries[key] = data
+            self.hits += 1
+            return data
+
+
+    def Put(self, key, data):
+        '''Store data under key, then drop old entries if needed.'''
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                key, old = self.entries.popitem(last = False)
+                self.size -= len(old)
+
+
+
+class _Handler(SocketServer.BaseRequestHandler):
+    '''One client connection.
+
+    Requests are read by a thread of their own and lexed on the pool.
+    Replies are queued by whoever has them ready, e.g. the result thread
+    of the pool, and sent by the thread of the connection. A slow client
+    only holds up its own replies, and requests are pipelined.
+    '''
+
+    def setup(self):
+        # Ids of the requests still to be replied
+        self.pending = set()
+
+        # Guards pending
+        self.lock = threading.Lock()
+
+        # (request_id, status, body) of the replies to send, None once
+        # the client is gone
+        self.replies = Queue.Queue()
+
+
+    def handle(self):
+        reader = threading.Thread(target = self.__Read)
+        reader.daemon = True
+        reader.start()
+        while True:
+            reply = self.replies.get()
+            if reply is None:
+                break
+            try:
+                self.request.sendall(_Frame(*reply))
+            except socket.error:
+                # The client is gone, wake the reader up
+                try:
+                    self.request.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                break
+        reader.join()
+
+
+    def finish(self):
+        with self.lock:
+            self.pending.clear()
+
+
+    def __Read(self):
+        '''Read and dispatch requests until the client closes.'''
+        try:
+            while True:
+                try:
+                    frame = _ReadFrame(self.request)
+                except socket.error:
+                    break
+                if frame is None:
+                    break
+                request_id, code, body = frame
+                if code == OP_LEX:
+                    self.__Lex(request_id, body)
+                elif code == OP_CANCEL:
+                    self.__Cancel(request_id)
+                else:
+                    self.replies.put((request_id, STATUS_ERROR,
+                                      'unknown operation %d' % code))
+        finally:
+            self.replies.put(None)
+
+
+    def __Lex(self, request_id, body):
+        service = self.server.service
+        try:
+            engine, decode, size = LEX_HEADER.unpack_from(body)
+            engine = LuaLexParser.ENGINES[engine]
+        except (struct.error, IndexError):
+            self.replies.put((request_id, STATUS_ERROR, 'malformed request'))
+            return
+        start = LEX_HEADER.size + size
+        key, source = body[LEX_HEADER.size:start], body[start:]
+        if key:
+            key = 'k' + key
+        else:
+            key = 'h' + hashlib.sha1(source).digest()
+        key = (engine, bool(decode), key)
+
+        data = service.cache.Get(key)
+        if data is not None:
+            self.replies.put((request_id, STATUS_OK, data))
+            return
+        with self.lock:
+            self.pending.add(request_id)
+
+        def Done(ok, data):
+            with self.lock:
+                if request_id not in self.pending:
+                    return
+                self.pending.remove(request_id)
+            if ok:
+                self.replies.put((request_id, STATUS_OK, data))
+            else:
+                self.replies.put((request_id, STATUS_ERROR, data))
+
+        service.Lex(key, (source, engine, decode), Done)
+
+
+    def __Cancel(self, request_id):
+        '''Reply a pending request as cancelled. A job already on the
+        pool still runs, its result is cached but not sent.
+        '''
+        with self.lock:
+            if request_id not in self.pending:
+                return
+            self.pending.remove(request_id)
+        self.replies.put((request_id, STATUS_CANCELLED, ''))
+
+
+class _TCPServer(SocketServer.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(SocketServer, 'ThreadingUnixStreamServer'):
+    class _UnixServer(SocketServer.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+
+class LexServer(object):
+    '''The lexing service.
+
+    -address is the path of a Unix domain socket, or a (host, port)
+     tuple for TCP.
+    -jobs is the number of worker processes, None for the CPU count.
+    -cache_bytes is the size of the ResultCache.
+    '''
+
+    def __init__(self, address, jobs = None, cache_bytes = 64 << 20):
+        self.address = address
+        self.cache = ResultCache(cache_bytes)
+
+        # Callbacks waiting for the result of each key being lexed
+        self.inflight = {}
+
+        # Guards inflight
+        self.lock = threading.Lock()
+
+        # Fork the workers before any thread is started
+        self.pool = multiprocessing.Pool(jobs)
+        try:
+            if isinstance(address, tuple):
+                self.server = _TCPServer(address, _Handler)
+            else:
+                if os.path.exists(address):
+                    os.remove(address)
+                self.server = _UnixServer(address, _Handler)
+        except:
+            self.pool.terminate()
+            raise
+        self.server.service = self
+
+
+    def Lex(self, key, job, callback):
+        '''Lex a source on the pool, then cache the result and call
+        callback(ok, data) on the result thread of the pool.
+
+        -job is the argument of _LexSource().
+        -If key is being lexed already, callback waits for that job.
+        '''
+        with self.lock:
+            waiters = self.inflight.get(key)
+            if waiters is not None:
+                waiters.append(callback)
+                return
+            self.inflight[key] = [callback]
+
+        def Done(result):
+            ok, data = result
+            if ok:
+                self.cache.Put(key, data)
+            with self.lock:
+                waiters = self.inflight.pop(key)
+            for waiter in waiters:
+                waiter(ok, data)
+
+        self.pool.apply_async(_LexSource, (job,), callback = Done)
+
+
+    def ServeForever(self):
+        '''Handle requests until Shutdown() is called.'''
+        self.server.serve_forever()
+
+
+    def Shutdown(self):
+        '''Stop ServeForever(), from another thread.'''
+        self.server.shutdown()
+
+
+    def Close(self):
+        '''Close the socket and stop the workers.'''
+        self.server.server_close()
+        self.pool.terminate()
+        self.pool.join()
+        if not isinstance(self.address, tuple):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+
+
+
+class LexClient(object):
+    '''A connection to a LexServer.
+
+    Lex() is a plain call. For pipelining, Submit() several requests
+    and collect their replies with Receive().
+    '''
+
+    def __init__(self, address):
+        if isinstance(address, tuple):
+            self.sock = socket.create_connection(address)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(address)
+        self.ids = itertools.count(1)
+
+
+    def Close(self):
+        self.sock.close()
+
+
+    def Submit(self, source, key = '', engine = 'regex', decode = True):
+        '''Send a lex request.
+
+        -source is a str, unicode texts are sent UTF-8 encoded.
+        -key names this version of the source for the cache of the
+         server, e.g. a path and a modification time. If it is empty,
+         the server hashes the source.
+        -Return the id of the request.
+        '''
+        if isinstance(source, unicode):
+            source = source.encode('utf-8')
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        request_id = next(self.ids)
+        body = (LEX_HEADER.pack(LuaLexParser.ENGINES.index(engine),
+                                int(bool(decode)), len(key)) +
+                key + source)
+        self.sock.sendall(_Frame(request_id, OP_LEX, body))
+        return request_id
+
+
+    def Cancel(self, request_id):
+        '''Ask the server to drop a request.'''
+        self.sock.sendall(_Frame(request_id, OP_CANCEL))
+
+
+    def Receive(self):
+        '''Wait for the next reply.
+
+        -Return (request_id, status, body), body is a token file for
+         STATUS_OK, see BinaryTokens, or an error message.
+        -Raise EOFError if the server closed the connection.
+        '''
+        frame = _ReadFrame(self.sock)
+        if frame is None:
+            raise EOFError('connection closed by the server')
+        return frame
+
+
+    def Lex(self, source, key = '', engine = 'regex', decode = True):
+        '''Lex source on the server.
+
+        -Return a BinaryTokens of the reply.
+        -Raise RuntimeError if the server fails to lex it.
+        '''
+        request_id = self.Submit(source, key, engine, decode)
+        while True:
+            reply_id, status, body = self.Receive()
+            if reply_id == request_id:
+                break
+        if status != STATUS_OK:
+            raise RuntimeError(body or 'request cancelled')
+        return BinaryTokens(data = body)
+
+
+def __main():
+    parser = argparse.ArgumentParser(
+        description = 'Serve lexing requests on a local socket.')
+    address = parser.add_mutually_exclusive_group(required = True)
+    address.add_argument('-u', '--unix', metavar = 'PATH',
+                         help = 'listen on the Unix domain socket PATH')
+    address.add_argument('-p', '--port', type = int,
+                         help = 'listen on localhost PORT')
+    parser.add_argument('-j', '--jobs', type = int, default = None,
+                        help = 'worker processes (default: CPU count)')
+    parser.add_argument('--cache-size', type = int, default = 64,
+                        metavar = 'MB',
+                        help = 'keep results up to MB megabytes')
+    args = parser.parse_args()
+
+    if args.unix:
+        address = args.unix
+    else:
+        address = ('127.0.0.1', args.port)
+    server = LexServer(address, args.jobs, args.cache_size << 20)
+    sys.stderr.write('listening on %s\n' % (address,))
+    try:
+        server.ServeForever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.Close()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    __main()
@@ -0,0 +1,177 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexStats.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, profiling counters of LuaLexParser.
+#   + label the report with the engine, it times the routines of its
+#     engine only.
+#   + count the rows each batch appends and time whole batches instead
+#     of GetToken() calls, drop the seconds per type.
+#   + count intern hits and misses from the growth of the value tables.
+
+import timeit
+import itertools
+
+
+class LexStats(object):
+    '''Profiling counters of one LuaLexParser.
+
+    A parser made with stats = True wraps the batch routine of its
+    engine (LuaLexParser.BATCH_ROUTINES) and the routines that engine
+    calls (LuaLexParser.TIMED_ROUTINES) with the hooks of this class.
+    Nothing is wrapped otherwise, so a parser without stats runs exactly
+    the code it runs without this module.
+
+    Every batch is timed as a whole. The rows it appends to the token
+    and comment tables are counted afterwards, outside the timed part,
+    so GetToken(), Lex(), IterTokens() and the binary output are all
+    counted alike. Tokens loaded from a LexCache are not lexed and not
+    counted.
+
+    The regex engine lexes a whole batch in __LexRegex, its per-kind
+    routines only see the lexemes it does not finish by itself: first
+    sightings of names and numbers (__Lexeme), long brackets and
+    unfinished strings (__LongLexeme).
+
+    'tokens'  maps a TOKENTYPE name to the number of its tokens
+    'bytes'   maps a TOKENTYPE name to the characters of its tokens
+    'blanks'  is the number of characters skipped between tokens
+    'batches' is the number of batches lexed
+    'calls'   maps a routine name to the number of its calls
+    'times'   maps a routine name to the time spent in it
+    'interns' maps a value table name to [hits, misses]. A token whose
+              value is in its table already is a hit, one that adds its
+              value is a miss, whichever way the engine looked it up.
+    'elapsed' is the time spent lexing batches
+    'engine'  is the engine of the parser
+    '''
+
+    clock = staticmethod(timeit.default_timer)
+
+    # Value tables, each is named like the type of its tokens
+    VALUE_TABLES = ('consts', 'strings', 'symbols', 'err_descs')
+
+    def __init__(self, type_names, engine = None):
+        self.type_names = type_names
+        self.engine = engine
+        self.tokens = dict.fromkeys(type_names, 0)
+        self.bytes = dict.fromkeys(type_names, 0)
+        self.blanks = 0
+        self.batches = 0
+        self.calls = {}
+        self.times = {}
+        self.interns = dict([(name, [0, 0]) for name in self.VALUE_TABLES])
+        self.elapsed = 0.0
+
+
+    def Batches(self, parser, lex_batch):
+        '''Return lex_batch, the batch routine of parser, timing it and
+        counting the rows it appends.
+        '''
+        clock = self.clock
+
+        def LexBatch(count):
+            tokens, comments = parser.token_descs, parser.comments
+            seq, comment = len(tokens), len(comments)
+            pos = parser.stream.pos
+            sizes = [len(getattr(parser, name))
+                     for name in self.VALUE_TABLES]
+
+            start = clock()
+            result = lex_batch(count)
+            self.elapsed += clock() - start
+            self.batches += 1
+
+            # Tokens of each type in this batch, comments included
+            added = dict.fromkeys(self.type_names, 0)
+            nbytes = self.__Count(tokens, seq, added) + \
+                     self.__Count(comments, comment, added)
+            end = min(parser.stream.pos, len(parser.stream.buf))
+            self.blanks += max(0, end - pos - nbytes)
+            for name, size in zip(self.VALUE_TABLES, sizes):
+                misses = len(getattr(parser, name)) - size
+                counts = self.interns[name]
+                counts[0] += added[name] - misses
+                counts[1] += misses
+            return result
+        return LexBatch
+
+
+    def __Count(self, table, seq, added):
+        '''Count the rows of table from seq on into added and into the
+        totals.
+
+        -Return the characters of those rows.
+        '''
+        # The regex engine leaves the ends to the table
+        table.Settle()
+        names = self.type_names
+        types = table.types[seq:]
+        nbytes = dict.fromkeys(set(types), 0)
+        for type_id, offset, end in itertools.izip(types,
+                                                   table.offsets[seq:],
+                                                   table.ends[seq:]):
+            nbytes[type_id] += end - offset
+        for type_id, count in nbytes.iteritems():
+            name = names[type_id]
+            n = types.count(type_id)
+            added[name] += n
+            self.tokens[name] += n
+            self.bytes[name] += count
+        return sum(nbytes.values())
+
+
+    def Timed(self, name, func):
+        '''Return func, timing its calls as routine name.'''
+        clock = self.clock
+        self.calls[name] = 0
+        self.times[name] = 0.0
+
+        def Call(*args):
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                self.times[name] += clock() - start
+                self.calls[name] += 1
+        return Call
+
+
+    def TokenCount(self):
+        '''Return the number of tokens, comments included.'''
+        return sum(self.tokens.values())
+
+
+    def TokensPerSecond(self):
+        '''Return the tokens lexed per second.'''
+        return self.TokenCount() / max(self.elapsed, 1e-9)
+
+
+    def Report(self):
+        '''Return the counters as lines of text.'''
+        lines = ['%s engine: %d token(s), %d blank(s) in %d batch(es), '
+                 '%.3fs, %.0f tokens/s'
+                 % (self.engine, self.TokenCount(), self.blanks,
+                    self.batches, self.elapsed, self.TokensPerSecond()),
+                 '',
+                 '%-12s %10s %12s' % ('type', 'tokens', 'bytes')]
+        for name in self.type_names:
+            if self.tokens[name]:
+                lines.append('%-12s %10d %12d'
+                             % (name, self.tokens[name], self.bytes[name]))
+
+        lines.extend(['', '%-24s %10s %10s' % ('routine', 'calls',
+                                               'seconds')])
+        for name in sorted(self.calls):
+            lines.append('%-24s %10d %10.3f'
+                         % (name, self.calls[name], self.times[name]))
+
+        lines.extend(['', '%-12s %10s %10s %8s' % ('table', 'hits',
+                                                   'misses', 'hit %')])
+        for name in sorted(self.interns):
+            hits, misses = self.interns[name]
+            ratio = 100.0 * hits / max(hits + misses, 1)
+            lines.append('%-12s %10d %10d %8.1f'
+                         % (name, hits, misses, ratio))
+        return lines
@@ -0,0 +1,848 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexTables.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, InternTable for the lexer's value tables.
+#   + add TokenDesc and the column oriented TokenTable.
+#   + add CheckpointTable and splicing for incremental re-lexing.
+#   + keep per type position indexes in TokenTable, add Select().
+#   + add end offsets and columns to tokens, add LineIndex.
+#   + add ConstTable, numbers stored in an array of doubles.
+#   + add Dump() and Load() to the tables for the token cache.
+#   + add Extend() for merging tables lexed in parallel.
+#   + append tokens in batches, build the position indexes on first use.
+#   + add AppendLexemes(), ends and columns worked out on first use.
+#   + add ShiftArray, splicing moves the rows after an edit lazily.
+
+import array
+import bisect
+import heapq
+import operator
+import itertools
+
+
+class InternTable(list):
+    '''A list without duplicate elements, backed by a hash map.
+
+    The table is still a plain ordered list for readers, e.g.
+    GetTokenInfo() or the GUI, but Intern(), index() and the 'in'
+    operator take O(1) instead of a linear scan.
+
+    'key' maps an element to its hashable identity. It is needed for
+    unhashable elements, e.g. the error descriptor dicts.
+
+    [Note]:
+    -Only append(), Intern() and Clear() keep the hash map in sync,
+     do NOT modify the table in any other way.
+    '''
+
+    def __init__(self, key = None):
+        list.__init__(self)
+        self.key = key
+        self.lookup = {}
+
+
+    def __Key(self, value):
+        if self.key is None:
+            return value
+        return self.key(value)
+
+
+    def Intern(self, value):
+        '''Add value to the table if it is not there yet.
+
+        -Return the index of value in the table.
+        '''
+        k = self.__Key(value)
+        idx = self.lookup.get(k)
+        if idx is None:
+            idx = len(self)
+            self.lookup[k] = idx
+            list.append(self, value)
+        return idx
+
+
+    def append(self, value):
+        '''Same as Intern(), but return nothing like list.append().'''
+        self.Intern(value)
+
+
+    def index(self, value):
+        '''Return the index of value, raise ValueError if not found.'''
+        idx = self.lookup.get(self.__Key(value))
+        if idx is None:
+            raise ValueError('%r is not in table' % (value,))
+        return idx
+
+
+    def __contains__(self, value):
+        return self.__Key(value) in self.lookup
+
+
+    def Clear(self):
+        '''Remove all elements.'''
+        del self[:]
+        self.lookup.clear()
+
+
+class ConstTable(object):
+    '''A table of distinct numbers stored as C doubles.
+
+    It reads like an InternTable of floats, but the values are kept in
+    one array('d'), 8 bytes each instead of a float object and a list
+    slot. 'lookup' maps a value to its index.
+    '''
+
+    def __init__(self):
+        self.values = array.array('d')
+        self.lookup = {}
+
+
+    def Intern(self, value):
+        '''Add value to the table if it is not there yet.
+
+        -Return the index of value in the table.
+        '''
+        idx = self.lookup.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.lookup[value] = idx
+            self.values.append(value)
+        return idx
+
+
+    def append(self, value):
+        '''Same as Intern(), but return nothing like list.append().'''
+        self.Intern(value)
+
+
+    def index(self, value):
+        '''Return the index of value, raise ValueError if not found.'''
+        idx = self.lookup.get(value)
+        if idx is None:
+            raise ValueError('%r is not in table' % (value,))
+        return idx
+
+
+    def __contains__(self, value):
+        return value in self.lookup
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+    def Clear(self):
+        '''Remove all elements.'''
+        del self.values[:]
+        self.lookup.clear()
+
+
+    def Dump(self):
+        '''Return the values as a string of machine doubles.'''
+        return self.values.tostring()
+
+
+    def Load(self, data):
+        '''Replace the values with the ones of a Dump().'''
+        self.Clear()
+        self.values.fromstring(data)
+        self.lookup.update(itertools.izip(self.values, itertools.count()))
+
+
+class ShiftArray(object):
+    '''An array whose elements from 'mark' on read 'delta' more than they
+    are stored.
+
+    Shift() moves the tail of the array by some delta. Only the elements
+    between the old and the new mark are touched, so a series of edits
+    close to each other costs what the edits touch, not the length of
+    the array. A stored element holds either its value or the value it
+    had before the pending delta, so an unsigned array stays unsigned.
+
+    Indexing, slices, iteration and the bisect module read the shifted
+    values. 'values' is the underlying array, it is exact once Settle()
+    applied the pending delta.
+    '''
+
+    def __init__(self, typecode, values = ()):
+        self.values = array.array(typecode, values)
+        self.typecode = typecode
+        self.mark = 0
+        self.delta = 0
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def __getitem__(self, i):
+        value = self.values[i]
+        if self.delta:
+            if isinstance(i, slice):
+                return self.__Shifted(i, value)
+            if i < 0:
+                i += len(self.values)
+            if i >= self.mark:
+                value += self.delta
+        return value
+
+
+    def __Shifted(self, item, values):
+        '''Return the values of a slice of the array with the pending
+        delta applied.
+        '''
+        start, stop, step = item.indices(len(self.values))
+        if step != 1:
+            return array.array(self.typecode,
+                               [self[i] for i in xrange(start, stop, step)])
+        k = max(self.mark - start, 0)
+        if k < len(values):
+            _Add(values, k, len(values), self.delta)
+        return values
+
+
+    def __delitem__(self, i):
+        self.Settle()
+        del self.values[i]
+
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+    def append(self, value):
+        if self.delta:
+            self.Settle()
+        self.values.append(value)
+
+
+    def extend(self, values):
+        if self.delta and values:
+            self.Settle()
+        self.values.extend(values)
+
+
+    def fromlist(self, values):
+        if self.delta and values:
+            self.Settle()
+        self.values.fromlist(values)
+
+
+    def tolist(self):
+        return self[:].tolist()
+
+
+    def tostring(self):
+        self.Settle()
+        return self.values.tostring()
+
+
+    def Settle(self):
+        '''Apply the pending delta to the stored elements.'''
+        if self.delta:
+            _Add(self.values, self.mark, len(self.values), self.delta)
+            self.delta = 0
+
+
+    def Shift(self, start, delta):
+        '''Add delta to the elements from start on.
+
+        It takes O(k) for the k elements between start and the last
+        shifted position.
+        '''
+        if not delta:
+            return
+        if not self.delta:
+            self.mark, self.delta = start, delta
+        elif start <= self.mark:
+            # The elements up to the mark get their final values
+            _Add(self.values, start, self.mark, delta)
+            self.delta += delta
+        else:
+            # The elements up to start get their current values
+            _Add(self.values, self.mark, start, self.delta)
+            self.mark = start
+            self.delta += delta
+
+
+    def Splice(self, start, stop, new, new_delta = 0, tail_delta = 0):
+        '''Replace the elements [start:stop] with new, then add the
+        deltas to the new elements and to the ones after them.
+
+        -new is an iterable of values, e.g. an array or a ShiftArray.
+
+        The stored elements are moved by one C memmove, only the ones
+        between the edit and the last shifted position are rewritten.
+        '''
+        if self.delta and self.mark < stop:
+            # The new elements go in front of the mark
+            _Add(self.values, self.mark, stop, self.delta)
+            self.mark = stop
+        if isinstance(new, ShiftArray):
+            new = new[:]
+        new = array.array(self.typecode, new)
+        if new_delta:
+            _Add(new, 0, len(new), new_delta)
+        self.values[start:stop] = new
+        end = start + len(new)
+        if self.delta:
+            self.mark += end - stop
+        self.Shift(end, tail_delta)
+
+
+class TokenDesc(object):
+    '''A token descriptor.
+
+    It reads like the dicts returned by LuaLexParser.GetToken(), e.g.
+    token['type'] or token.get('seq'), and costs a handful of slots
+    instead of a dict. TokenTable builds one for each row it returns.
+
+    'type' is the index to LuaLexParser.TOKENTYPE
+    'index' is the index to the corresponding list
+    'line' is the line number of this token
+    'offset' is the position of its first character in the source
+    'end' is the position after its last character
+    'column' is the position of its first character in its line
+    'seq' is the index to the token table, -1 if it is not in the table
+    'gen' is the generation of the parser that made this token
+    '''
+
+    __slots__ = ('type', 'index', 'line', 'offset', 'end', 'column',
+                 'seq', 'gen')
+
+    def __init__(self, type_id = None, index = None, line = None,
+                 offset = None, end = None, column = None, seq = -1,
+                 gen = None):
+        self.type = type_id
+        self.index = index
+        self.line = line
+        self.offset = offset
+        self.end = end
+        self.column = column
+        self.seq = seq
+        self.gen = gen
+
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+
+    def get(self, key, default = None):
+        return getattr(self, key, default)
+
+
+    def __repr__(self):
+        return '{%s}' % ', '.join(['%r: %r' % (k, getattr(self, k))
+                                   for k in self.__slots__])
+
+
+class TokenTable(object):
+    '''A compact, column oriented token table.
+
+    Each token takes one row of six parallel arrays:
+
+    'types'   array('B'), the index to LuaLexParser.TOKENTYPE
+    'indexes' array('i'), the index to the corresponding list
+    'lines'   array('i'), the line number
+    'offsets' array('I'), the position of the first character
+    'ends'    array('I'), the position after the last character
+    'columns' array('i'), the position of the first character in its line
+
+    Lines and columns are signed so that they read back as ints, not
+    longs.
+
+    'positions' maps each token type to a ShiftArray('i') of the seqs of
+    its tokens, in increasing order. Select() uses them to find the tokens
+    of some types without scanning the whole table. They cost nothing
+    per appended token: Positions() builds them on first use and then
+    only indexes the rows appended since, 'indexed' is the number of
+    rows they cover.
+
+    'lines', 'offsets' and 'ends' are ShiftArrays, an edit moves the rows
+    after it lazily, see Splice(). Rows added by AppendLexemes() have no
+    ends and columns yet, they are worked out by Settle() for all
+    'pending' batches at once. The methods of the table settle it when
+    they need to. Call Settle() before reading 'ends' or 'columns' or
+    the underlying 'values' of the ShiftArrays directly, 'settled' is
+    True while nothing is left to settle.
+
+    Indexing the table returns a TokenDesc built from the row, so
+    token_descs[i]['type'] still works. 'generation' is copied into
+    every TokenDesc built by the table.
+    '''
+
+    COLUMNS = (('type', 'types', 'B'), ('index', 'indexes', 'i'),
+               ('line', 'lines', 'i'), ('offset', 'offsets', 'I'),
+               ('end', 'ends', 'I'), ('column', 'columns', 'i'))
+
+    # Columns moved by edits, they are ShiftArrays
+    SHIFTED = ('lines', 'offsets', 'ends')
+
+    def __init__(self, generation = None):
+        self.generation = generation
+        for key, attr, typecode in self.COLUMNS:
+            setattr(self, attr, _Column(attr, typecode))
+        self.positions = {}
+        self.indexed = 0
+
+        # (seq, lexemes, line_starts, fixups) of each AppendLexemes()
+        # batch without ends and columns
+        self.pending = []
+        self.settled = True
+
+
+    def Append(self, type_id, index, line, offset, end, column):
+        '''Add a token to the table.
+
+        -Return the sequence number, i.e. the row, of the new token.
+        '''
+        if self.pending:
+            self.__SettleBatches()
+        seq = len(self.types)
+        self.types.append(type_id)
+        self.indexes.append(index)
+        self.lines.append(line)
+        self.offsets.append(offset)
+        self.ends.append(end)
+        self.columns.append(column)
+        return seq
+
+
+    def AppendColumns(self, types, indexes, lines, offsets, ends, columns):
+        '''Add a batch of tokens, given as one list per column.
+
+        Each array is extended once for the whole batch, so the cost per
+        token is a C loop, not a method call.
+        '''
+        if self.pending:
+            self.__SettleBatches()
+        self.types.fromlist(types)
+        self.indexes.fromlist(indexes)
+        self.lines.fromlist(lines)
+        self.offsets.fromlist(offsets)
+        self.ends.fromlist(ends)
+        self.columns.fromlist(columns)
+
+
+    def AppendLexemes(self, lexemes, lines, offsets, line_starts, fixups):
+        '''Add a batch of tokens whose ends and columns are left to
+        Settle().
+
+        -lexemes are (type, index, length) tuples, one per token.
+        -line_starts maps the lines of the batch to their start offsets.
+         The column of a token is its offset minus the start of its line.
+        -fixups are the (row in the batch, column) of the tokens whose
+         line is not the one they start on, e.g. block strings.
+        '''
+        self.pending.append((len(self.types), lexemes, line_starts, fixups))
+        self.settled = False
+        self.types.fromlist(map(_TYPE, lexemes))
+        self.indexes.fromlist(map(_INDEX, lexemes))
+        self.lines.fromlist(lines)
+        self.offsets.fromlist(offsets)
+
+
+    def Settle(self):
+        '''Work out the ends and columns of the 'pending' batches and
+        apply the pending shifts.
+        '''
+        self.__SettleBatches()
+        for attr in self.SHIFTED:
+            getattr(self, attr).Settle()
+        self.settled = True
+
+
+    def __SettleBatches(self):
+        '''Work out the ends and columns of the 'pending' batches.'''
+        for seq, lexemes, line_starts, fixups in self.pending:
+            stop = seq + len(lexemes)
+            offsets = self.offsets[seq:stop].tolist()
+            self.ends.fromlist(map(operator.add, offsets,
+                                   map(_LENGTH, lexemes)))
+            columns = map(operator.sub, offsets,
+                          map(line_starts.__getitem__,
+                              self.lines[seq:stop].tolist()))
+            for i, column in fixups:
+                columns[i] = column
+            self.columns.fromlist(columns)
+        self.pending = []
+
+
+    def Positions(self, type_id):
+        '''Return the array('i') of the seqs of the tokens of type_id.
+
+        The arrays are brought up to date with the rows appended since
+        the last call first, see 'positions'.
+        '''
+        if self.indexed < len(self.types):
+            self.__Index()
+        return self.positions.get(type_id, _NO_POSITIONS)
+
+
+    def __Index(self):
+        '''Add the rows after 'indexed' to the position arrays.'''
+        found = {}
+        appends = {}
+        start = self.indexed
+        for seq, type_id in enumerate(self.types[start:], start):
+            append = appends.get(type_id)
+            if append is None:
+                seqs = found[type_id] = array.array('i')
+                append = appends[type_id] = seqs.append
+            append(seq)
+        for type_id, seqs in found.iteritems():
+            positions = self.positions.get(type_id)
+            if positions is None:
+                positions = self.positions[type_id] = ShiftArray('i')
+            positions.extend(seqs)
+        self.indexed = len(self.types)
+
+
+    def __len__(self):
+        return len(self.types)
+
+
+    def __getitem__(self, seq):
+        if isinstance(seq, slice):
+            return [self[i] for i in xrange(*seq.indices(len(self)))]
+        if seq < 0:
+            seq += len(self)
+        if not 0 <= seq < len(self):
+            raise IndexError('token table index out of range')
+        if self.pending:
+            self.__SettleBatches()
+        return TokenDesc(self.types[seq], self.indexes[seq],
+                         self.lines[seq], int(self.offsets[seq]),
+                         int(self.ends[seq]), self.columns[seq],
+                         seq, self.generation)
+
+
+    def __iter__(self):
+        for seq in xrange(len(self)):
+            yield self[seq]
+
+
+    def Splice(self, start, stop, other, line_delta, offset_delta):
+        '''Replace rows [start:stop] with all rows of other.
+
+        Rows after stop are moved by line_delta and offset_delta. Their
+        columns stay, rows after an edit start on a later line. The rows
+        are moved lazily, see ShiftArray, so the cost grows with the
+        rows between this edit and the last one, not with the table.
+        '''
+        # Position arrays nobody asked for are not kept up to date
+        indexed = self.indexed
+        if indexed and indexed < len(self):
+            self.__Index()
+        self.__SettleBatches()
+        other.__SettleBatches()
+
+        self.types[start:stop] = other.types
+        self.indexes[start:stop] = other.indexes
+        self.lines.Splice(start, stop, other.lines, 0, line_delta)
+        self.offsets.Splice(start, stop, other.offsets, 0, offset_delta)
+        self.ends.Splice(start, stop, other.ends, 0, offset_delta)
+        self.columns[start:stop] = other.columns
+        self.settled = False
+        if not indexed:
+            return
+        if other.indexed < len(other):
+            other.__Index()
+
+        # Seqs of other start at 0, seqs after stop move by seq_delta
+        seq_delta = len(other) - (stop - start)
+        for type_id in set(self.positions) | set(other.positions):
+            positions = self.positions.get(type_id)
+            if positions is None:
+                positions = self.positions[type_id] = ShiftArray('i')
+            i = bisect.bisect_left(positions, start)
+            j = bisect.bisect_left(positions, stop)
+            new = other.positions.get(type_id, _NO_POSITIONS)
+            positions.Splice(i, j, new, start, seq_delta)
+        self.indexed = len(self)
+
+
+    def Extend(self, other, line_delta, offset_delta):
+        '''Append all rows of other, moved by line_delta and offset_delta.
+        '''
+        self.__SettleBatches()
+        other.__SettleBatches()
+        end = len(self)
+        self.types.extend(other.types)
+        self.indexes.extend(other.indexes)
+        self.lines.Splice(end, end, other.lines, line_delta)
+        self.offsets.Splice(end, end, other.offsets, offset_delta)
+        self.ends.Splice(end, end, other.ends, offset_delta)
+        self.columns.extend(other.columns)
+        self.settled = False
+
+
+    def Select(self, types = None, start = 0, stop = None):
+        '''Find the tokens of some types in rows [start:stop].
+
+        -types is a collection of token types, None for all types.
+        -Return the seqs of the tokens found, in increasing order.
+         It takes O(k * log(m)) for k tokens of m types.
+        '''
+        if stop is None:
+            stop = len(self)
+        if types is None:
+            return xrange(start, max(start, stop))
+
+        found = []
+        for type_id in types:
+            positions = self.Positions(type_id)
+            if positions:
+                i = bisect.bisect_left(positions, start)
+                j = bisect.bisect_left(positions, stop)
+                if i < j:
+                    found.append(positions[i:j])
+        if not found:
+            return []
+        if len(found) == 1:
+            return found[0]
+        return list(heapq.merge(*found))
+
+
+    def LineRange(self, first, last):
+        '''Return the (start, stop) rows of the tokens on lines first to
+        last, inclusive. Lines never decrease from one row to the next.
+        '''
+        return (bisect.bisect_left(self.lines, first),
+                bisect.bisect_right(self.lines, last))
+
+
+    def OffsetRange(self, start, end):
+        '''Return the (start, stop) rows of the tokens beginning at
+        offsets start to end, inclusive.
+        '''
+        return (bisect.bisect_left(self.offsets, start),
+                bisect.bisect_right(self.offsets, end))
+
+
+    def ToNumpy(self):
+        '''Export the columns as NumPy arrays, without copying them.
+
+        -Return a dict: {'type':??, 'index':??, 'line':??, 'offset':??,
+                         'end':??, 'column':??}
+        -e.g. numpy.bincount(columns['type']) is a token type histogram,
+         numpy.bincount(columns['line']) the token count of each line.
+
+        [Note]:
+        -The arrays share memory with the table. They are only valid
+         until the next token is appended, so take copies if the table
+         is still growing.
+        -Requires NumPy.
+        '''
+        import numpy
+        self.Settle()
+        columns = {}
+        for key, attr, typecode in self.COLUMNS:
+            col = getattr(self, attr)
+            if attr in self.SHIFTED:
+                col = col.values
+            dtype = numpy.dtype(typecode)
+            if len(col):
+                columns[key] = numpy.frombuffer(col, dtype = dtype)
+            else:
+                # frombuffer() refuses empty buffers
+                columns[key] = numpy.zeros(0, dtype = dtype)
+        return columns
+
+
+    def Dump(self):
+        '''Return the rows as a list of strings, which can be written
+        with marshal, see Load(). The position arrays are left out,
+        Positions() builds them again.
+        '''
+        self.Settle()
+        return [getattr(self, attr).tostring()
+                for key, attr, typecode in self.COLUMNS]
+
+
+    def Load(self, data):
+        '''Replace the rows with the ones of a Dump().'''
+        for (key, attr, typecode), col in zip(self.COLUMNS, data):
+            setattr(self, attr, _Column(attr, typecode, col))
+        self.positions = {}
+        self.indexed = 0
+        self.pending = []
+        self.settled = True
+
+
+class CheckpointTable(object):
+    '''Restart points of the lexer, one for each line start where the
+    lexer is outside of any token.
+
+    'offsets' ShiftArray('I'), the position of the line start
+    'lines'   ShiftArray('i'), the line number
+    'seqs'    ShiftArray('i'), the number of tokens in the token table
+              before this point
+
+    Lines inside a block string, a block comment or an escaped line
+    string have no checkpoint, so lexing can be restarted at any
+    checkpoint with nothing but its line number.
+    '''
+
+    def __init__(self):
+        self.offsets = ShiftArray('I')
+        self.lines = ShiftArray('i')
+        self.seqs = ShiftArray('i')
+
+
+    def Append(self, offset, line, seq):
+        '''Add a checkpoint, offsets must be increasing.'''
+        self.offsets.append(offset)
+        self.lines.append(line)
+        self.seqs.append(seq)
+
+
+    def AppendColumns(self, offsets, lines, seqs):
+        '''Add a batch of checkpoints, given as one list per column.'''
+        self.offsets.fromlist(offsets)
+        self.lines.fromlist(lines)
+        self.seqs.fromlist(seqs)
+
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+    def Find(self, offset):
+        '''Return the index of the last checkpoint at or before offset,
+        or -1 if there is none.
+        '''
+        return bisect.bisect_right(self.offsets, offset) - 1
+
+
+    def IndexOf(self, offset):
+        '''Return the index of the checkpoint at offset, or -1.'''
+        i = bisect.bisect_left(self.offsets, offset)
+        if i < len(self.offsets) and self.offsets[i] == offset:
+            return i
+        return -1
+
+
+    def Splice(self, start, stop, other, seq_base, line_delta,
+               offset_delta, seq_delta):
+        '''Replace checkpoints [start:stop] with the ones of other.
+
+        -The seqs of other are relative to seq_base.
+        -Checkpoints after stop are moved by the deltas, lazily, see
+         ShiftArray.
+        '''
+        self.offsets.Splice(start, stop, other.offsets, 0, offset_delta)
+        self.lines.Splice(start, stop, other.lines, 0, line_delta)
+        self.seqs.Splice(start, stop, other.seqs, seq_base, seq_delta)
+
+
+    def Extend(self, other, line_delta, offset_delta, seq_delta):
+        '''Append the checkpoints of other, moved by the deltas.'''
+        end = len(self)
+        self.offsets.Splice(end, end, other.offsets, offset_delta)
+        self.lines.Splice(end, end, other.lines, line_delta)
+        self.seqs.Splice(end, end, other.seqs, seq_delta)
+
+
+    def Dump(self):
+        '''Return the checkpoints as a tuple of strings, see Load().'''
+        return (self.offsets.tostring(), self.lines.tostring(),
+                self.seqs.tostring())
+
+
+    def Load(self, data):
+        '''Replace the checkpoints with the ones of a Dump().'''
+        offsets, lines, seqs = data
+        self.offsets = ShiftArray('I', offsets)
+        self.lines = ShiftArray('i', lines)
+        self.seqs = ShiftArray('i', seqs)
+
+
+class LineIndex(object):
+    '''Start offsets of the lines of a source.
+
+    It is built with bulk newline search, so it knows the physical lines
+    of the source. Lines are numbered from 1 and columns from 0, like the
+    'line' and 'column' of a token.
+    '''
+
+    def __init__(self, buf):
+        starts = array.array('I', [0])
+        find = buf.find
+        nl = find('\n')
+        while nl >= 0:
+            starts.append(nl + 1)
+            nl = find('\n', nl + 1)
+        self.starts = starts
+        self.size = len(buf)
+
+
+    def __len__(self):
+        '''Return the number of lines.'''
+        return len(self.starts)
+
+
+    def LineStart(self, line):
+        '''Return the offset of the first character of line, O(1).'''
+        return int(self.starts[line - 1])
+
+
+    def LineEnd(self, line):
+        '''Return the offset of the linefeed ending line, or the size of
+        the source for the last line. O(1).
+        '''
+        if line < len(self.starts):
+            return int(self.starts[line]) - 1
+        return self.size
+
+
+    def Offset(self, line, column):
+        '''Return the offset of (line, column), O(1).'''
+        return int(self.starts[line - 1]) + column
+
+
+    def Position(self, offset):
+        '''Return the (line, column) of offset, O(log(lines)).'''
+        line = bisect.bisect_right(self.starts, offset)
+        return (line, offset - int(self.starts[line - 1]))
+
+
+# Positions() of a type without tokens, never modified
+_NO_POSITIONS = ShiftArray('i')
+
+# Fields of the lexemes of AppendLexemes()
+_TYPE = operator.itemgetter(0)
+_INDEX = operator.itemgetter(1)
+_LENGTH = operator.itemgetter(2)
+
+
+def _Column(attr, typecode, data = ()):
+    '''Return a new column of a TokenTable.'''
+    if attr in TokenTable.SHIFTED:
+        return ShiftArray(typecode, data)
+    return array.array(typecode, data)
+
+
+def _Add(values, start, stop, delta):
+    '''Add delta to values[start:stop] of an array.'''
+    if start < stop:
+        values[start:stop] = array.array(values.typecode, map(
+            operator.add, values[start:stop],
+            itertools.repeat(delta, stop - start)))
@@ -0,0 +1,188 @@
+# -*- coding: UTF-8 -*-
+# @file:    LexTest.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, regression tests of the lexer.
+#   + test the size accounting of LexCache.TokenCache.
+#   + test reading the tables on a second thread during Lex().
+#   + test the profiling counters of Lex().
+
+'''Regression tests of the lexer.
+
+usage: LexTest.py [-v]
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+import threading
+import unittest
+
+from LuaLexParser import LuaLexParser
+from LexCache import TokenCache
+
+
+def _OneLine(statements):
+    '''Return a source of one line of statements, 6 tokens each.'''
+    return ' '.join(['x = y + 1 ;'] * statements)
+
+
+
+class StreamingTest(unittest.TestCase):
+    '''Batches end after a bounded number of tokens, even on sources
+    without line starts, e.g. minified ones.
+    '''
+
+    STATEMENTS = 5000
+
+    def testIterTokensOneLine(self):
+        source = _OneLine(self.STATEMENTS)
+        records = {}
+        for engine in LuaLexParser.ENGINES:
+            lex = LuaLexParser(source = source, engine = engine)
+            largest = 0
+            found = []
+            for record in lex.IterTokens(retain = False):
+                found.append(record)
+                largest = max(largest, len(lex.token_descs))
+            self.assertEqual(len(found), self.STATEMENTS * 6)
+            self.assertTrue(largest <= LuaLexParser.STREAM_TABLE_LIMIT,
+                            '%s: %d rows' % (engine, largest))
+            records[engine] = found
+        self.assertEqual(records['regex'], records['char'])
+
+
+    def testGetTokenOneLine(self):
+        source = _OneLine(self.STATEMENTS)
+        for engine in LuaLexParser.ENGINES:
+            lex = LuaLexParser(source = source, engine = engine)
+            token = lex.GetToken()
+            self.assertEqual((token['offset'], token['end']), (0, 1))
+            self.assertTrue(len(lex.token_descs) <= LuaLexParser.BATCH,
+                            '%s: %d rows' % (engine, len(lex.token_descs)))
+
+
+
+class SharedLexTest(unittest.TestCase):
+    '''Lex(shared = True) lets another thread read the tables, the way
+    LexFrame reads them while a LexJob lexes.
+    '''
+
+    LINES = 20000
+
+    # Tokens lexed by each Lex() call, like LexFrame.LexJob.BATCH
+    STEP = 2048
+
+    def setUp(self):
+        # Switch threads often, so that they interleave a lot
+        self.interval = sys.getcheckinterval()
+        sys.setcheckinterval(10)
+
+
+    def tearDown(self):
+        sys.setcheckinterval(self.interval)
+
+
+    def testReadWhileLexing(self):
+        source = '\n'.join(['local x%d = y[%d] .. "s%d" -- c' % (i, i, i)
+                            for i in xrange(self.LINES)])
+        lex = LuaLexParser(source = source)
+        done = threading.Event()
+        errors = []
+        reads = [0]
+
+        def Read():
+            table = lex.token_descs
+            symbols = set([LuaLexParser.TYPE_SYMBOLS])
+            try:
+                while not done.isSet():
+                    # Read between events, like the GUI
+                    time.sleep(0.001)
+                    with lex.lock:
+                        size = len(table)
+                        if not size:
+                            continue
+                        token = table[size - 1]
+                        if token['end'] <= token['offset']:
+                            errors.append(token)
+                        table.Select(symbols, max(0, size - 100), size)
+                        lex.GetTokenInfos(max(0, size - 100), size)
+                    reads[0] += 1
+            except Exception as e:
+                errors.append(e)
+
+        reader = threading.Thread(target = Read)
+        reader.start()
+        try:
+            stop = 0
+            more = True
+            while more:
+                stop += self.STEP
+                more = lex.Lex(stop, shared = True)
+        finally:
+            done.set()
+            reader.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(reads[0] > 0)
+        expected = LuaLexParser(source = source)
+        expected.Lex()
+        expected.token_descs.Settle()
+        for key, attr, typecode in lex.token_descs.COLUMNS:
+            self.assertTrue(getattr(lex.token_descs, attr).tolist() ==
+                            getattr(expected.token_descs, attr).tolist(),
+                            attr)
+
+
+class StatsTest(unittest.TestCase):
+    '''The profiling counters count every lexed token, however it is
+    read.
+    '''
+
+    def testLex(self):
+        source = _OneLine(1000) + '\n-- c\nlocal s = "x" .. 1.5\n'
+        for engine in LuaLexParser.ENGINES:
+            lex = LuaLexParser(source = source, engine = engine,
+                               stats = True)
+            lex.Lex()
+            stats = lex.stats
+            self.assertEqual(stats.TokenCount(),
+                             len(lex.token_descs) + len(lex.comments))
+            self.assertEqual(stats.tokens['COMMENTS'], 1)
+            self.assertEqual(stats.bytes['strings'], 3)
+            self.assertEqual(stats.interns['symbols'],
+                             [stats.tokens['symbols'] - len(lex.symbols),
+                              len(lex.symbols)])
+            self.assertEqual(stats.blanks + sum(stats.bytes.values()),
+                             len(source))
+
+
+class TokenCacheTest(unittest.TestCase):
+    '''TokenCache.size matches the entries on disk.'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testStoreTwice(self):
+        cache = TokenCache(self.directory)
+        state = ['x' * 100000, range(1000)]
+        cache.Store('key', state)
+        cache.Store('key', state)
+        cache.Store('key', state[:1])
+        entries = [os.path.join(self.directory, name)
+                   for name in os.listdir(self.directory)]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(cache.size, os.path.getsize(entries[0]))
+        self.assertEqual(cache.Load('key'), state[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,13 +4,52 @@
 # @change:
 #   2010-03-20
 #   + initial version, supports most of Lua 5.1 lexical conventions.
-
-
-from StrStream import StringStream
+#   2026-10-18
+#   + add the regex scanning engine, selectable by the 'engine' argument.
+#   + read the source through a BufferStream.
+#   + keep consts, strings, symbols and err_descs in InternTables.
+#   + stamp tokens with a sequence number and a parser generation,
+#     add GetTokenInfos().
+#   + store tokens in a column oriented TokenTable.
+#   + add IterTokens() for streaming with bounded memory.
+#   + move the output loop of __main() to DumpTokenInfos().
+#   + record line start checkpoints, add Relex() for incremental
+#     re-lexing of edited sources.
+#   + lex in-memory sources given by the 'source' argument, handle EOF
+#     without a trailing linefeed.
+#   + give tokens end offsets and columns, add GetLineIndex().
+#   + lex decoded unicode sources, see the 'decode' argument.
+#   + find the end of long brackets and line strings by substring search,
+#     both engines share the scanners.
+#   + match number literals with NUMBER_RE, memoize their conversion and
+#     keep consts in a ConstTable.
+#   + load and store the tables through an optional LexCache.TokenCache.
+#   + add the -b option for binary token files.
+#   + add optional profiling counters, see the 'stats' argument and the
+#     --stats option.
+#   + make GetState() and SetState() public, add RecordComments() and
+#     the -j option for lexing one source on several processes.
+#   + add TokenInfoView, GetTokenInfo() tuples resolved on access.
+#   + lex memory mapped files, see the 'mapped' argument and the -m
+#     option.
+#   + lex in batches into the tables, GetToken() reads the tokens back,
+#     add Lex(). Comments are always kept, drop RecordComments().
+#   + GetToken() reads the tokens back a batch at a time, see __Replay().
+#   + regex batches end after count tokens, also in the middle of a line.
+#   + add Lex(shared = True) and self.lock for reading on other threads.
+#   + count the profiling counters per batch, --stats refuses -j.
+
+
+from StrStream import BufferStream
+from LexTables import InternTable, ConstTable, TokenTable, CheckpointTable
+from LexTables import LineIndex
 import string
-import types
+import re
+import bisect
+import itertools
+import threading
 
-class LuaLexParser:
+class LuaLexParser(object):
     '''A Lua lexical parser written in Python.
 
     This class implements a lexical parser compatiable with Lua 5.1.
@@ -44,16 +83,144 @@ class LuaLexParser:
     CHARS = string.letters + string.digits + string.punctuation
     LINE_STRING = ("'", '"')
 
-
-    def __init__(self, filename):
+    # Runs consumed at once by the char engine
+    NAME_CHARS = string.letters + string.digits + '_'
+    ALNUMS = string.letters + string.digits
+
+    # Scanning engines
+    #
+    # 'char' reads the stream one character at a time.
+    # 'regex' jumps over whole lexemes with a compiled master pattern.
+    ENGINES = ('char', 'regex')
+
+    # Precomputed ids, so the regex engine never calls tuple.index()
+    TYPE_KEYWORDS = TOKENTYPE.index('KEYWORDS')
+    TYPE_OPS = TOKENTYPE.index('OPS')
+    TYPE_DELIMITERS = TOKENTYPE.index('DELIMITERS')
+    TYPE_COMMENTS = TOKENTYPE.index('COMMENTS')
+    TYPE_CONSTS = TOKENTYPE.index('consts')
+    TYPE_STRINGS = TOKENTYPE.index('strings')
+    TYPE_SYMBOLS = TOKENTYPE.index('symbols')
+    TYPE_ERRORS = TOKENTYPE.index('err_descs')
+
+    # Rows of the lexemes known by their text: keywords, ops and
+    # delimiters. Each maps to (type, index, length), see self.lexemes.
+    LEXEMES = {}
+    for type_id, names in ((TYPE_KEYWORDS, KEYWORDS), (TYPE_OPS, OPS),
+                           (TYPE_DELIMITERS, DELIMITERS)):
+        for i, k in enumerate(names):
+            LEXEMES[k] = (type_id, i, len(k))
+    del type_id, names, i, k
+
+    # Number literals, including the malformed ones, e.g. '1e' or '12ab'.
+    # A literal is taken as a whole: a hex number, or digits with an
+    # optional fraction and exponent, followed by any letters and digits
+    # that stick to it.
+    NUMBER = r'''0[xX][0-9A-Za-z]*
+          |-?[0-9]+(?:\.(?:[0-9]+%(tail)s?)?|%(tail)s)?
+          |\.[0-9]+%(tail)s?''' % {'tail':r'(?:[eE][+-]?[0-9A-Za-z]*'
+                                            r'|[A-DF-Za-df-z][0-9A-Za-z]*)'}
+    NUMBER_RE = re.compile(NUMBER, re.VERBOSE)
+
+    # Master pattern of the regex engine.
+    #
+    # Leading blanks of the line are skipped, then exactly one of the
+    # numbered groups matches. The group number is the lexeme kind, see
+    # the L_* constants below. Names, numbers, operators and delimiters
+    # all match group 1, their text tells them apart. A '-' or a '[' in
+    # there must not open a comment or a long bracket.
+    MASTER_RE = re.compile(r'''[^!-~\n]*(?:
+          ([A-Za-z_][A-Za-z0-9_]*
+          |%(number)s
+          |[<>=]=?|~=|-(?!-)|[+*/^%%#]
+          |\.\.?\.?|[()\]{},;:]|\[(?!=*\[))         # 1 name, number, op...
+        | (\n[^!-~]*)                               # 2 line starts
+        | (--\[=*\[)                                # 3 block comment
+        | (--[^\n]*)                                # 4 line comment
+        | (\[=*\[)                                  # 5 block string
+        | "([^"\\\n]*(?:\\[\s\S][^"\\\n]*)*)"       # 6 line string
+        | '([^'\\\n]*(?:\\[\s\S][^'\\\n]*)*)'       # 7 line string
+        | (["'])                                    # 8 unfinished string
+        | ([!-~])                                   # 9 unexpected symbol
+        )''' % {'number':NUMBER}, re.VERBOSE)
+
+    (L_LEXEME, L_LINES, L_BLOCK_COMMENT, L_LINE_COMMENT, L_BLOCK_STRING,
+     L_STRING, L_STRING_SQ, L_UNFINISHED, L_UNEXPECTED) = range(1, 10)
+
+    # First characters of number literals, the other lexemes of group 1
+    # not in LEXEMES are names
+    NUMBER_STARTS = frozenset(string.digits + '.-')
+
+    # Line string bodies, the closing quote is checked separately.
+    # A backslash escapes any character, even a linefeed.
+    LINE_STRING_RE = {
+        '"': re.compile(r'(?:[^"\\\n]|\\[\s\S]?)*'),
+        "'": re.compile(r"(?:[^'\\\n]|\\[\s\S]?)*"),
+        }
+
+    # Tokens that may span lines: block comments, block strings, line
+    # strings with escaped linefeeds and their unfinished forms
+    MULTILINE_TYPES = (TYPE_COMMENTS, TYPE_STRINGS, TYPE_ERRORS)
+
+    # Source of parser generation ids
+    _generations = itertools.count(1)
+
+    # IterTokens(retain = False) empties the tables at this many tokens
+    STREAM_TABLE_LIMIT = 4096
+
+    # Tokens lexed at once when GetToken() runs out of lexed ones
+    BATCH = 1024
+
+    # Tokens lexed at once by Lex()
+    LEX_BATCH = 16384
+
+    # Bump it whenever the tokens of some source change, it is part of
+    # the key of cached tokens
+    LEXER_VERSION = 1
+
+
+    def __init__(self, filename = None, engine = 'regex', source = None,
+                 decode = True, cache = None, stats = False,
+                 mapped = False):
         '''Initialize per instance stuff.
 
         'filename' is lua source file.
+        'engine' is one of ENGINES.
+        'source' is the lua source itself, used instead of filename.
+        It can be a unicode text, a str or any object supporting the
+        buffer protocol, see StrStream.BufferStream.
+        'decode' tells whether to decode the source. If it is False,
+        offsets are byte offsets of the source as given.
+        'cache' is a LexCache.TokenCache or None. If the source was lexed
+        before, its tokens are loaded from the cache and GetToken() just
+        reads them back. Otherwise they are stored once the lexer reaches
+        the EOF.
+        'stats' turns on the profiling counters in self.stats, see
+        LexStats. Without it, self.stats is None and nothing is counted.
+        'mapped' lexes the file through a memory map instead of reading
+        it, see StrStream.BufferStream. Nothing is read up front, the
+        source is lexed byte by byte like with decode False. Close() the
+        parser to unmap the file.
         '''
-        self.stream = StringStream(filename)
+        if engine not in self.ENGINES:
+            raise ValueError('Unknown scanning engine: %r' % (engine,))
+        if filename is None and source is None:
+            raise ValueError('Either filename or source is required')
+
+        self.stream = BufferStream(filename, source, decode, mapped)
         self.filename = filename
+        self.engine = engine
         self.linenum = 1
 
+        # Offset of the first character of the current physical line
+        self.line_start = 0
+
+        # LineIndex of the source, built by GetLineIndex()
+        self.line_index = None
+
+        # Tokens are only valid for the parser generation they carry
+        self.generation = next(self._generations)
+
         # Numerical constants list
         #
         # Each element is a constant.
@@ -61,13 +228,23 @@ class LuaLexParser:
         #
         # Note:
         # There's no duplicate elements in the list.
-        self.consts= []
+        self.consts = ConstTable()
+
+        # Number literals converted so far
+        #
+        # Each literal maps to the (type, index) pair of its tokens, so a
+        # repeated literal is never converted twice.
+        self.num_memo = {}
+
+        # Rows of the lexemes met by the regex engine, by their text:
+        # LEXEMES plus the names and numbers lexed so far
+        self.lexemes = dict(self.LEXEMES)
 
         # String literals
         #
         # Note:
         # There's no duplicate elements in the list
-        self.strings = []
+        self.strings = InternTable()
 
         # Valid symbol list
         #
@@ -75,7 +252,7 @@ class LuaLexParser:
         #
         # Note:
         # There's no duplicate elements in the list.
-        self.symbols = []
+        self.symbols = InternTable()
 
         # Unexpected symbol list
         #
@@ -84,17 +261,121 @@ class LuaLexParser:
         #
         # 'symbol' is the unexpected symbol
         # 'err_idx' is the index to the msgs tuple
-        self.err_descs = []
+        #
+        # Note:
+        # Descriptors with the same symbol and err_id are stored once.
+        self.err_descs = InternTable(
+            key = lambda err: (err['symbol'], err['err_id']))
 
         # Token descriptor table
         #
-        # Each element is a TokenDesc:
-        # {'type':??, 'index':??, 'line':??}
+        # Tokens are stored in columns, each element reads as a TokenDesc,
+        # which looks like the dicts returned by GetToken():
+        # {'type':??, 'index':??, 'line':??, 'offset':??, 'end':??,
+        #  'column':??, 'seq':??, 'gen':??}
         #
         # 'type' is the index to TOKENTYPE
         # 'index' is the index to the corresponding list
         # 'line' is the line number of this token
-        self.token_descs = []
+        # 'offset' is the position of this token in the source
+        # 'end' is the position after this token in the source
+        # 'column' is the position of this token in its line
+        # 'seq' is the index to token_descs, -1 for comments
+        # 'gen' is the generation of the parser that made this token
+        self.token_descs = TokenTable(self.generation)
+
+        # Restart points for Relex(), one for each line start between
+        # tokens, see LexTables.CheckpointTable
+        self.checkpoints = CheckpointTable()
+
+        # Comments, a TokenTable like token_descs, their 'seq' is -1
+        self.comments = TokenTable(self.generation)
+
+        # Rows of the batch being lexed, see __LexBatch()
+        self.batch = []
+
+        # Held by Lex(shared = True) while it adds a batch, threads that
+        # read the tables meanwhile hold it too
+        self.lock = threading.Lock()
+
+        # Key of the source in cache, None once there is nothing to store
+        self.cache = cache
+        self.cache_key = None
+
+        # [seq, comment], the rows of token_descs and comments that
+        # GetToken() returns next, and the __Replay() returning them
+        self.__Rewind(0, 0)
+
+        if cache is not None:
+            key = cache.Key(self.stream.buf, self.LEXER_VERSION, engine)
+            state = cache.Load(key)
+            if state is not None:
+                self.SetState(state)
+            else:
+                self.cache_key = key
+
+        # Profiling counters, see LexStats
+        self.stats = None
+        if stats:
+            self.__Instrument()
+
+
+    # Batch routine of each engine, counted by the profiling counters
+    BATCH_ROUTINES = {'regex':'__LexRegex', 'char':'__LexChar'}
+
+    # Routines timed by the profiling counters, those each engine calls
+    TIMED_ROUTINES = {
+        'regex':('__Lexeme', '__LongLexeme',
+                 '__ProcessLineString', '__ProcessBlockComment',
+                 '__ProcessBlockString', '__ConvertToNum'),
+        'char':('__ProcessLineString', '__ProcessLineComment',
+                '__ProcessBlockComment', '__ProcessBlockString',
+                '__ProcessNumber', '__ConvertToNum'),
+        }
+
+    def __Instrument(self):
+        '''Wrap the batch routine and the TIMED_ROUTINES of the engine with
+        the hooks of a LexStats.
+
+        The wrappers are instance attributes, they shadow the methods of
+        this parser only.
+        '''
+        from LexStats import LexStats
+        stats = self.stats = LexStats(self.TOKENTYPE, self.engine)
+        for name in self.TIMED_ROUTINES[self.engine]:
+            attr = '_LuaLexParser' + name
+            setattr(self, attr, stats.Timed(name[2:], getattr(self, attr)))
+        attr = '_LuaLexParser' + self.BATCH_ROUTINES[self.engine]
+        setattr(self, attr, stats.Batches(self, getattr(self, attr)))
+
+
+    def __Checkpoint(self, offset):
+        '''Record that a line starts at offset, outside of any token.'''
+        self.line_start = offset
+        self.checkpoints.Append(offset, self.linenum,
+                                len(self.token_descs) + len(self.batch))
+
+
+    def __ScanLongBracket(self, pos, count):
+        '''Find the closing delimiter of a long bracket, that is ']'
+        followed by count '=' and ']'.
+
+        -pos is the first position after the opening delimiter.
+        -Return the position of the closing delimiter, or -1 if we reach
+         the EOF. The stream is moved after the delimiter, or to the EOF.
+
+        The delimiter is located by one substring search and the
+        linefeeds of the lexeme are counted at once.
+        '''
+        buf = self.stream.buf
+        close = buf.find(']' + '=' * count + ']', pos)
+        if close < 0:
+            end = len(buf)
+        else:
+            end = close + count + 2
+        self.linenum += buf.count('\n', pos, end)
+        self.stream.Seek(end)
+        return close
 
 
     def __ProcessLineString(self, end):
@@ -103,22 +384,21 @@ class LuaLexParser:
         -Return a tuple(string, status).
          If status is True, string holds the string.
          If status is False, string is the unexpected symbol.
-         '''
-        s, status = '', False
-        c = self.stream.GetNextChar()
-        ends = (end, '\n', '')
-        while c not in ends:
-            s += c
-            if c == '\\':
-                s += self.stream.GetNextChar()
-            c = self.stream.GetNextChar()
-        if c == end:
-            status = True
-        else:
-            # For counting the line number
-            self.stream.UnGetChar()
 
-        return (s, status)
+        A backslash escapes any character, escaped linefeeds are counted.
+        '''
+        stream = self.stream
+        m = self.LINE_STRING_RE[end].match(stream.buf, stream.pos)
+        s = m.group()
+        self.linenum += s.count('\n')
+        pos = m.end()
+        if stream.buf[pos:pos + 1] == end:
+            stream.Seek(pos + 1)
+            return (s, True)
+
+        # Stop before the '\n' for counting the line number
+        stream.Seek(pos)
+        return (s, False)
 
 
 
@@ -127,10 +407,10 @@ class LuaLexParser:
 
         No return value.
         '''
-        ends = ('\n', '')
-        while self.stream.GetNextChar() not in ends:
-            pass
-        self.stream.UnGetChar()
+        end = self.stream.Find('\n')
+        if end < 0:
+            end = len(self.stream.buf)
+        self.stream.Seek(end)
 
 
     def __ProcessBlockComment(self, count):
@@ -140,24 +420,7 @@ class LuaLexParser:
         -Return False if no block commtn delimiter is found.
          In this case, we'll reach the EOF.
         '''
-        c = self.stream.GetNextChar()
-        while c != '':
-            if c == ']':
-                c = self.stream.GetNextChar()
-                i = 0
-                while i < count and c == '=':
-                    c = self.stream.GetNextChar()
-                    i += 1
-                if i >= count and c == ']':
-                    # Block comment is finished here
-                    return True;
-            elif c == '\n':
-                self.linenum += 1
-
-            c = self.stream.GetNextChar()
-        else:
-            # Unfinished block comment
-            return False
+        return self.__ScanLongBracket(self.stream.pos, count) >= 0
 
 
     def __ProcessBlockString(self, count):
@@ -171,174 +434,47 @@ class LuaLexParser:
         -If the first character of the block string is '\n',
          it is dropped intentionally(Lua does this trick).
         '''
-        status, bstr = False, ''
-
-        c = self.stream.GetNextChar()
+        buf, pos = self.stream.buf, self.stream.pos
         # Drop the first character if it is a linefeed
-        if c == '\n':
+        if buf[pos:pos + 1] == '\n':
             self.linenum += 1
-            c = self.stream.GetNextChar()
+            pos += 1
 
-        while c != '':
-            if c == ']':
-                buf = c
-                c = self.stream.GetNextChar()
-                i = 0
-                while i < count and c == '=':
-                    c = self.stream.GetNextChar()
-                    buf += c
-                    i += 1
-                if i >= count and c == ']':
-                    # Block string is finished here
-                    status = True
-                    break
-                else:
-                    # Not the expected block string delimiter,
-                    # append buf to bstr
-                    bstr += buf
-            elif c == '\n':
-                self.linenum += 1
-
-            bstr += c
-            c = self.stream.GetNextChar()
-        else:
+        close = self.__ScanLongBracket(pos, count)
+        if close < 0:
             # Unfinished block string
-            bstr = '<EOF>'
+            return (False, '<EOF>')
+        return (True, buf[pos:close])
 
-        return (status, bstr)
 
+    def __ProcessNumber(self):
+        '''Retrieve a number from stream.
 
-    def __ProcessHex(self):
-        '''Retrieve a hex number from stream.
-
-        -Assume stream is started with '0x' or '0X'
-        -Return a string that may be a hex number.
+        -Assume stream is started with digits|.|-
+        -Return the whole literal matched by NUMBER_RE, it may be a
+         malformed number. Return '' if there is none, e.g. at a '.'
+         followed by no digit.
         '''
-        buf = ''
-        buf += self.stream.GetNextChar()
-        buf += self.stream.GetNextChar()
-
-        c = self.stream.GetNextChar()
-        while c.isalnum():
-            buf += c
-            c = self.stream.GetNextChar()
-        self.stream.UnGetChar()
-        return buf
+        m = self.NUMBER_RE.match(self.stream.buf, self.stream.pos)
+        if m is None:
+            return ''
+        self.stream.Seek(m.end())
+        return m.group()
 
 
-    def __ProcessFloat(self):
-        '''Retrieve a floating-point number from stream.
-
-        -Assume stream is started with digits|.|+|-
-        -Return a string that may be a number
+    def __ParseNum(self, str_num):
+        '''Return the value of a number literal, None if it is malformed.
         '''
-        ## re = '-?/d*(.?/d+(e|E)?(+|-)?/d+)?'
-        buf = ''
-        state = 1
-
-        c = self.stream.GetNextChar()
-        while c.isalnum() or (c in '+-.'):
-            if state == 1:
-                if c.isdigit():
-                    state = 2
-                elif c == '.':
-                    state = 3
-                elif c in '+-':
-                    state = 9
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 2:
-                if c.isdigit():
-                    state = 2
-                elif c == '.':
-                    state = 3
-                elif c in 'eE':
-                    state = 5
-                elif c.isalpha():
-                    state = 8
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 3:
-                if c.isdigit():
-                    state = 4
-                elif buf[-1].isdigit() and c.isalpha():
-                    state = 8
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 4:
-                if c.isdigit():
-                    state = 4
-                elif c in 'eE':
-                    state = 5
-                elif c.isalpha():
-                    state = 8
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 5:
-                if c.isalpha():
-                    state = 8
-                elif c in '+-':
-                    state = 6
-                elif c.isdigit():
-                    state = 7
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 6:
-                if c.isalpha():
-                    state = 8
-                elif c.isdigit():
-                    state = 7
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 7:
-                if c.isdigit():
-                    state = 7
-                elif c.isalpha():
-                    state = 8
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 8:
-                if c.isalnum():
-                    state = 8
-                else:
-                    self.stream.UnGetChar()
-                    break
-                buf += c
-                c = self.stream.GetNextChar()
-            elif state == 9:
-                if c.isdigit():
-                    state = 1
-                else:
-                    self.stream.UnGetChar()
-                    break
-            else:
-                # Unexpected state
-                break
-        else:
-            self.stream.UnGetChar()
-
-        return buf
+        try:
+            if str_num[:2] in ('0x', '0X'):
+                # Hex value must start with 0x or 0X in Lua
+                return float.fromhex(str_num)
+            return float(str_num)
+        except ValueError:
+            return None
+        except OverflowError:
+            # Too big for a double, like strtod() in Lua
+            return float('inf')
 
 
     def __ConvertToNum(self, dic):
@@ -347,64 +483,92 @@ class LuaLexParser:
         -No return value, fills a token_desc in dic['token'] instead.
         -The string to be converted is in dic['str']
         '''
-        num = 'NaN'
         str_num = dic['str']
-        try:
-            num = float(str_num)
-        except ValueError:
-            try:
-                # Hex value must start with 0x or 0X in Lua
-                if str_num[:2] in ('0x', '0X'):
-                    num = float.fromhex(str_num)
-                else:
-                    num = 'NaN'
-            except ValueError:
-                num = 'NaN'
-
-        if type(num) != types.FloatType:
-            # Oops! Not a number
-            err = {'symbol':str_num, 'err_id':0}
-            if err not in self.err_descs:
-                self.err_descs.append(err)
-            dic['token']['type'] = self.TOKENTYPE.index('err_descs')
-            dic['token']['index'] = self.err_descs.index(err)
+        found = self.num_memo.get(str_num)
+        if found is None:
+            num = self.__ParseNum(str_num)
+            if num is None:
+                # Oops! Not a number
+                err = {'symbol':str_num, 'err_id':0}
+                found = (self.TYPE_ERRORS, self.err_descs.Intern(err))
+            else:
+                found = (self.TYPE_CONSTS, self.consts.Intern(num))
+            self.num_memo[str_num] = found
+
+        dic['token']['type'], dic['token']['index'] = found
+
+
+    def __Lexeme(self, text):
+        '''Return the row of a name or a number seen for the first time,
+        and keep it in self.lexemes.
+
+        -Return (type, index, length), like the values of LEXEMES.
+        '''
+        if text[0] in self.NUMBER_STARTS:
+            token = {}
+            self.__ConvertToNum({'token':token, 'str':text})
+            row = (token['type'], token['index'], len(text))
         else:
-            if num not in self.consts:
-                self.consts.append(num)
-            dic['token']['type'] = self.TOKENTYPE.index('consts')
-            dic['token']['index'] = self.consts.index(num)
+            row = (self.TYPE_SYMBOLS, self.symbols.Intern(text), len(text))
+        self.lexemes[text] = row
+        return row
 
 
-    def GetToken(self):
-        '''Return the next token in the source file.
+    def __LongLexeme(self, kind, start, pos):
+        '''Finish a long bracket or an unfinished line string for the regex
+        engine.
 
-        -Return a token descriptor represented in a dict.
-            {'type':??, 'index':??, 'line':??}
-        -Return None if we reach the EOF.
+        -kind is the L_* group of its opening, which spans buf[start:pos].
+        -Return (type, index, line). The stream is moved behind the lexeme
+         and self.linenum counts its linefeeds.
         '''
+        stream = self.stream
+        stream.pos = pos
+        if kind == self.L_BLOCK_COMMENT:
+            if self.__ProcessBlockComment(pos - start - 4):
+                return (self.TYPE_COMMENTS, -1, self.linenum)
+            # Unfinished block comment
+            err = {'symbol':'<EOF>', 'err_id':3}
+        elif kind == self.L_BLOCK_STRING:
+            status, s = self.__ProcessBlockString(pos - start - 2)
+            if status:
+                return (self.TYPE_STRINGS, self.strings.Intern(s),
+                        self.linenum)
+            # Unfinished block string
+            err = {'symbol':s, 'err_id':4}
+        else:
+            line = self.linenum
+            s, status = self.__ProcessLineString(stream.buf[start])
+            if status:
+                return (self.TYPE_STRINGS, self.strings.Intern(s), line)
+            # Oops! Unfinished string?
+            err = {'symbol':s, 'err_id':2}
+            return (self.TYPE_ERRORS, self.err_descs.Intern(err), line)
+        return (self.TYPE_ERRORS, self.err_descs.Intern(err), self.linenum)
+
+
+    def __GetTokenChar(self):
+        '''GetToken() for the char engine.'''
         buf = ''
-        token = {}
 
         # Skip non-printable chars
+        pos = self.stream.pos
+        blanks = self.stream.TakeUntil(self.CHARS)
+        n = blanks.count('\n')
+        if n:
+            self.linenum += n
+            self.__Checkpoint(pos + blanks.rfind('\n') + 1)
+        token = {'offset':self.stream.pos}
         c = self.stream.GetNextChar()
-        while c not in self.CHARS:
-            if c == '\n':
-                self.linenum += 1
-            c = self.stream.GetNextChar()
-        else:
-            if c == '': # EOF
-                return None
+        if c == '': # EOF
+            return None
 
         token['line'] = self.linenum
         buf += c
 
         if c.isalpha() or c == '_':
             # Starts with a letter or an underscore
-            c = self.stream.GetNextChar()
-            while c.isalnum() or c == '_':
-                buf += c
-                c = self.stream.GetNextChar()
-            self.stream.UnGetChar()
+            buf += self.stream.TakeWhile(self.NAME_CHARS)
 
             if buf in self.KEYWORDS:
                 # It's a keyword
@@ -413,31 +577,19 @@ class LuaLexParser:
             else:
                 # It's a user-defined keyword
                 token['type'] = self.TOKENTYPE.index('symbols')
-                if buf not in self.symbols:
-                    self.symbols.append(buf)
-                token['index'] = self.symbols.index(buf)
+                token['index'] = self.symbols.Intern(buf)
         elif c.isdigit() or c in '.':
             # It may be a number
             # Numbers can not start with a '+' in Lua
             # Accepts:
             #   real: 0.44, 7.9E2, .98, -9.9, 99
             #   hex: 0xFF
-            str_num = None
-            if c == '0':
-                c1 = self.stream.GetNextChar()
-                self.stream.UnGetChar(-2)
-                if c1 in 'xX':
-                    str_num = self.__ProcessHex()
-                else:
-                    str_num = self.__ProcessFloat()
-            else:
-                self.stream.UnGetChar()
-                str_num = self.__ProcessFloat()
+            self.stream.UnGetChar()
+            str_num = self.__ProcessNumber()
 
-##            if str_num == '+':
-##                token['type'] = self.TOKENTYPE.index('OPS')
-##                token['index'] = self.OPS.index(str_num)
-            if str_num == '.':
+            if not str_num:
+                # No digit follows the '.'
+                self.stream.GetNextChar()
                 c = self.stream.GetNextChar()
                 if c == '.':
                     # It's '..' or '...'
@@ -452,7 +604,7 @@ class LuaLexParser:
                 else:
                     self.stream.UnGetChar()
                     token['type'] = self.TOKENTYPE.index('DELIMITERS')
-                    token['index'] = self.DELIMITERS.index(str_num)
+                    token['index'] = self.DELIMITERS.index('.')
             else:
                 # Convert it to a real number if possible
                 self.__ConvertToNum({'token':token, 'str':str_num})
@@ -461,17 +613,13 @@ class LuaLexParser:
             # It may be a line string
             s, status = self.__ProcessLineString(c)
             if status:
-                if s not in self.strings:
-                    self.strings.append(s)
                 token['type'] = self.TOKENTYPE.index('strings')
-                token['index'] = self.strings.index(s)
+                token['index'] = self.strings.Intern(s)
             else:
                 # Oops! Unfinished string?
                 err = {'symbol':s, 'err_id':2}
-                if err not in self.err_descs:
-                    self.err_descs.append(err)
                 token['type'] = self.TOKENTYPE.index('err_descs')
-                token['index'] = self.err_descs.index(err)
+                token['index'] = self.err_descs.Intern(err)
         elif c == '-':
             # It may be a comment or a number
             c1 = self.stream.GetNextChar()
@@ -490,11 +638,8 @@ class LuaLexParser:
                         if not status:
                             # Unfinished block comment
                             err = {'symbol':'<EOF>', 'err_id':3}
-                            if err not in self.err_descs:
-                                self.err_descs.append(err)
                             token['type'] = self.TOKENTYPE.index('err_descs')
-                            token['index'] = self.err_descs.index(err)
-                            self.token_descs.append(token)
+                            token['index'] = self.err_descs.Intern(err)
                             return token
                     else:
                         # It is a line comment
@@ -505,12 +650,11 @@ class LuaLexParser:
                     self.__ProcessLineComment()
                 token['type'] = self.TOKENTYPE.index('COMMENTS')
                 token['index'] = -1
-                # Do not append to token table
                 return token
             else:
-                if c1.isdigit():
+                if c1 and c1 in string.digits:
                     self.stream.UnGetChar(-2)
-                    str_num = self.__ProcessFloat()
+                    str_num = self.__ProcessNumber()
                     self.__ConvertToNum({'token':token, 'str':str_num})
                 else:
                     # It's an operator, '-'
@@ -531,16 +675,12 @@ class LuaLexParser:
                 if status:
                     # Store the string
                     token['type'] = self.TOKENTYPE.index('strings')
-                    if s not in self.strings:
-                        self.strings.append(s)
-                    token['index'] = self.strings.index(s)
+                    token['index'] = self.strings.Intern(s)
                 else:
                     # Unfinished block string
                     err = {'symbol':s, 'err_id':4}
-                    if err not in self.err_descs:
-                        self.err_descs.append(err)
                     token['type'] = self.TOKENTYPE.index('err_descs')
-                    token['index'] = self.err_descs.index(err)
+                    token['index'] = self.err_descs.Intern(err)
             else:
                 # It's a delimiter, '['
                 self.stream.UnGetChar(-i-1)
@@ -558,10 +698,8 @@ class LuaLexParser:
                     # Unexpected symbols '~'
                     self.stream.UnGetChar()
                     err = {'symbol':c, 'err_id':1}
-                    if err not in self.err_descs:
-                        self.err_descs.append(err)
                     token['type'] = self.TOKENTYPE.index('err_descs')
-                    token['index'] = self.err_descs.index(err)
+                    token['index'] = self.err_descs.Intern(err)
                 else:   # It's '~='
                     token['type'] = self.TOKENTYPE.index('OPS')
                     token['index'] = self.OPS.index('~=')
@@ -577,16 +715,522 @@ class LuaLexParser:
         else:
             # Unexpected symbols
             err = {'symbol':c, 'err_id':1}
-            if err not in self.err_descs:
-                self.err_descs.append(err)
             token['type'] = self.TOKENTYPE.index('err_descs')
-            token['index'] = self.err_descs.index(err)
+            token['index'] = self.err_descs.Intern(err)
 
-        # Add token to token table
-        self.token_descs.append(token)
         return token
 
 
+    def GetToken(self):
+        '''Return the next token in the source file.
+
+        -Return a token descriptor represented in a dict.
+            {'type':??, 'index':??, 'line':??, 'offset':??, 'end':??,
+             'column':??, 'seq':??, 'gen':??}
+        -Return None if we reach the EOF.
+
+        Tokens are lexed BATCH at a time into the tables, see Lex(), and
+        read back from there by __Replay(). Comments are merged in source
+        order.
+        '''
+        return next(self.replay_tokens, None)
+
+
+    def __Rewind(self, seq, comment):
+        '''Make GetToken() go on at token seq and at the given comment.'''
+        self.replay = [seq, comment]
+        self.replay_tokens = self.__Replay()
+
+
+    def __Replay(self):
+        '''Yield the GetToken() dicts from self.replay on, lexing BATCH
+        more tokens whenever the lexed ones run out.
+
+        The columns of up to BATCH tokens, and of the comments among
+        them, are sliced out of the tables at once, each dict then costs
+        one pass of a loop. self.replay follows each dict yielded.
+        '''
+        replay = self.replay
+        gen = self.generation
+        batch = self.BATCH
+        while True:
+            tokens, comments = self.token_descs, self.comments
+            seq, k = replay
+            # The columns are arrays, their len() is cheaper than the
+            # tables'
+            if seq >= len(tokens.types) and k >= len(comments.types):
+                if not self.__LexBatch(batch):
+                    return
+            if not (tokens.settled and comments.settled):
+                tokens.Settle()
+                comments.Settle()
+
+            # Settled, the values of the ShiftArrays are exact
+            offsets = tokens.offsets.values
+            comment_offsets = comments.offsets.values
+            size = len(offsets)
+            stop = min(seq + batch, size)
+            if stop < size:
+                k_stop = bisect.bisect_left(comment_offsets, offsets[stop],
+                                            k)
+            else:
+                k_stop = len(comment_offsets)
+
+            # (seq of the token behind, row) of each comment, in source
+            # order, then one that is never reached
+            cuts = iter([(bisect.bisect_left(offsets, comment_offsets[i],
+                                             seq, stop), i)
+                         for i in xrange(k, k_stop)] + [(-1, None)])
+            cut, k = next(cuts)
+            for seq, type_id, index, line, offset, end, column in \
+                    itertools.izip(xrange(seq, stop),
+                                   tokens.types[seq:stop],
+                                   tokens.indexes[seq:stop],
+                                   tokens.lines.values[seq:stop],
+                                   map(int, offsets[seq:stop]),
+                                   map(int, tokens.ends.values[seq:stop]),
+                                   tokens.columns[seq:stop]):
+                while cut == seq:
+                    replay[1] = k + 1
+                    yield self.__Comment(k)
+                    cut, k = next(cuts)
+                replay[0] = seq + 1
+                yield {'type':type_id, 'index':index, 'line':line,
+                       'offset':offset, 'end':end, 'column':column,
+                       'seq':seq, 'gen':gen}
+            while k is not None:
+                # Behind the last token of the batch
+                replay[1] = k + 1
+                yield self.__Comment(k)
+                cut, k = next(cuts)
+
+
+    def __Comment(self, k):
+        '''Return the GetToken() dict of the comment k.'''
+        comments = self.comments
+        return {'type':comments.types[k], 'index':comments.indexes[k],
+                'line':comments.lines.values[k],
+                'offset':int(comments.offsets.values[k]),
+                'end':int(comments.ends.values[k]),
+                'column':comments.columns[k], 'seq':-1,
+                'gen':comments.generation}
+
+
+    def Lex(self, stop = None, shared = False):
+        '''Lex ahead until token_descs holds stop tokens, or up to the
+        EOF if stop is None.
+
+        If shared is True, each batch is lexed and settled while holding
+        self.lock. Another thread may then read the tables while it holds
+        the lock, e.g. the GUI while LexFrame.LexJob lexes. It finds them
+        settled, so it never writes them.
+
+        -Return False once the EOF is reached.
+        -GetToken() still returns the tokens lexed ahead, in order.
+        '''
+        while stop is None or len(self.token_descs) < stop:
+            count = self.LEX_BATCH
+            if stop is not None:
+                count = min(count, max(stop - len(self.token_descs),
+                                       self.BATCH))
+            if shared:
+                with self.lock:
+                    more = self.__LexBatch(count)
+                    self.token_descs.Settle()
+                    self.comments.Settle()
+            else:
+                more = self.__LexBatch(count)
+            if not more:
+                return False
+        return True
+
+
+    def __LexBatch(self, count):
+        '''Lex up to count more tokens and comments into the tables.
+
+        -Return False if there was nothing left to lex.
+        '''
+        if self.engine == 'regex':
+            n, eof = self.__LexRegex(count)
+        else:
+            n, eof = self.__LexChar(count)
+
+        if eof and self.cache_key is not None:
+            self.cache.Store(self.cache_key, self.GetState())
+            self.cache_key = None
+        return n > 0
+
+
+    def __LexRegex(self, count):
+        '''__LexBatch() of the regex engine.
+
+        MASTER_RE.finditer() walks the source. A name, a number or an
+        operator costs one lookup of its text in self.lexemes and three
+        appends, other lexemes are told by their group. Long brackets and
+        unfinished strings are finished by __LongLexeme(), then the walk
+        restarts behind them. Each walk takes at most as many matches as
+        tokens are missing, so the batch ends after count tokens even in
+        the middle of a line, e.g. of a minified source. Ends and columns
+        are left to the table, see TokenTable.AppendLexemes().
+
+        -Return (tokens and comments lexed, whether the EOF is reached).
+        '''
+        stream = self.stream
+        buf, pos = stream.buf, stream.pos
+        size = len(buf)
+        get = self.lexemes.get
+        comments = self.comments
+        seq = len(self.token_descs)
+        finditer = self.MASTER_RE.finditer
+        islice = itertools.islice
+
+        # One row per token: (type, index, length), offset and line
+        rows, offsets, lines = [], [], []
+        add_row, add_offset, add_line = (rows.append, offsets.append,
+                                         lines.append)
+        linenum, line_start = self.linenum, self.line_start
+        # Start offsets of the lines of the batch
+        line_starts = {linenum:line_start}
+        # Checkpoints of the batch, one list per column
+        point_offsets, point_lines, point_seqs = [], [], []
+        # (row, column) of the tokens whose line is not their first one
+        fixups = []
+
+        n = 0
+        eof = False
+        while not eof and len(rows) < count:
+            m = None
+            for m in islice(finditer(buf, pos), count - len(rows)):
+                text = m.group(1)
+                if text is not None:
+                    row = get(text)
+                    if row is None:
+                        row = self.__Lexeme(text)
+                    add_row(row)
+                    add_offset(m.start(1))
+                    add_line(linenum)
+                    continue
+
+                kind = m.lastindex
+                if kind == 2:       # L_LINES
+                    text = m.group(2)
+                    linenum += text.count('\n')
+                    line_start = m.start(2) + text.rfind('\n') + 1
+                    line_starts[linenum] = line_start
+                    point_offsets.append(line_start)
+                    point_lines.append(linenum)
+                    point_seqs.append(seq + len(rows))
+                elif kind == 4:     # L_LINE_COMMENT
+                    start = m.start(4)
+                    comments.Append(self.TYPE_COMMENTS, -1, linenum, start,
+                                    m.end(4), start - line_start)
+                    n += 1
+                elif kind == 6 or kind == 7:
+                    # L_STRING, L_STRING_SQ
+                    s = m.group(kind)
+                    start = m.start(kind) - 1
+                    add_row((self.TYPE_STRINGS, self.strings.Intern(s),
+                             m.end() - start))
+                    add_offset(start)
+                    add_line(linenum)
+                    if '\n' in s:
+                        # Escaped linefeeds
+                        linenum += s.count('\n')
+                        line_start = start + s.rfind('\n') + 2
+                        line_starts[linenum] = line_start
+                elif kind == 9:     # L_UNEXPECTED
+                    err = {'symbol':m.group(9), 'err_id':1}
+                    add_row((self.TYPE_ERRORS, self.err_descs.Intern(err),
+                             1))
+                    add_offset(m.start(9))
+                    add_line(linenum)
+                else:
+                    start = m.start(kind)
+                    self.linenum = linenum
+                    type_id, index, line = self.__LongLexeme(kind, start,
+                                                             m.end())
+                    pos = stream.pos
+                    column = start - line_start
+                    if type_id == self.TYPE_COMMENTS:
+                        comments.Append(type_id, -1, line, start, pos,
+                                        column)
+                        n += 1
+                    else:
+                        if line != linenum:
+                            fixups.append((len(rows), column))
+                        add_row((type_id, index, pos - start))
+                        add_offset(start)
+                        add_line(line)
+                    linenum = self.linenum
+                    nl = buf.rfind('\n', start, pos)
+                    if nl >= 0:
+                        line_start = line_starts[linenum] = nl + 1
+                    break
+            else:
+                if m is None:
+                    pos = size
+                    eof = True
+                else:
+                    # Out of matches, go on behind the last one
+                    pos = m.end()
+
+        stream.pos = pos
+        self.linenum, self.line_start = linenum, line_start
+        if point_offsets:
+            self.checkpoints.AppendColumns(point_offsets, point_lines,
+                                           point_seqs)
+        if rows:
+            self.token_descs.AppendLexemes(rows, lines, offsets, line_starts,
+                                           fixups)
+        return (n + len(rows), eof)
+
+
+    def __LexChar(self, count):
+        '''__LexBatch() of the char engine, one GetToken() dict per token.
+
+        -Return (tokens and comments lexed, whether the EOF is reached).
+
+        The rows of the tokens are collected in self.batch and appended
+        to token_descs at once.
+        '''
+        buf = self.stream.buf
+        size = len(buf)
+        comments = self.comments
+        multiline = self.MULTILINE_TYPES
+        batch = self.batch = []
+        append = batch.append
+
+        n = 0
+        eof = False
+        while n < count:
+            token = self.__GetTokenChar()
+            if token is None:
+                eof = True
+                break
+            n += 1
+
+            # The char engine may have read past the EOF
+            offset = token['offset']
+            end = min(self.stream.pos, size)
+            column = offset - self.line_start
+            type_id = token['type']
+            if type_id in multiline:
+                nl = buf.rfind('\n', offset, end)
+                if nl >= 0:
+                    self.line_start = nl + 1
+
+            if type_id == self.TYPE_COMMENTS:
+                comments.Append(type_id, -1, token['line'], offset, end,
+                                column)
+            else:
+                append((type_id, token['index'], token['line'], offset,
+                        end, column))
+
+        if batch:
+            self.token_descs.AppendColumns(*map(list, zip(*batch)))
+        self.batch = []
+        return (n, eof)
+
+
+    def IterTokens(self, retain = False):
+        '''Yield the remaining tokens as self-contained records.
+
+        -Each record is a tuple (type_id, type_name, sym_value, line_num),
+         i.e. a GetTokenInfo() tuple without sym_idx. Comments are skipped.
+        -If retain is False, the token table and the value tables are
+         emptied every STREAM_TABLE_LIMIT tokens, so memory does not grow
+         with the file. The parser moves to a new generation then, and
+         tokens got before are no longer valid. Tokens loaded from a
+         cache are in memory already, they are never emptied.
+        '''
+        while True:
+            seq = self.replay[0]
+            stop = len(self.token_descs)
+            if seq >= stop:
+                if not self.__LexBatch(self.STREAM_TABLE_LIMIT):
+                    break
+                continue
+
+            self.__Rewind(stop, len(self.comments))
+            for type_id, type_name, sym_idx, sym_value, line_num in \
+                    self.GetTokenInfos(seq, stop):
+                yield (type_id, type_name, sym_value, line_num)
+
+            if not retain and stop >= self.STREAM_TABLE_LIMIT and \
+               self.stream.pos < len(self.stream.buf):
+                self.__Forget()
+
+
+    def __Forget(self):
+        '''Empty the token table and the value tables.
+
+        Every table grows by at most one element per token, so they are
+        all bounded by the size of the token table.
+        '''
+        self.generation = next(self._generations)
+        self.token_descs = TokenTable(self.generation)
+        self.comments = TokenTable(self.generation)
+        self.checkpoints = CheckpointTable()
+        self.__Rewind(0, 0)
+        self.consts.Clear()
+        self.num_memo.clear()
+        self.lexemes = dict(self.LEXEMES)
+        self.strings.Clear()
+        self.symbols.Clear()
+        self.err_descs.Clear()
+
+        # The tables no longer hold the whole source
+        self.cache_key = None
+
+
+    def GetState(self):
+        '''Return the tables of the lexed source as plain data, e.g. for
+        TokenCache.Store().
+
+        -The whole source must be lexed, e.g. by Lex(), and nothing
+         emptied by IterTokens().
+        '''
+        errors = [(err['symbol'], err['err_id']) for err in self.err_descs]
+        return (self.token_descs.Dump(), self.comments.Dump(),
+                self.checkpoints.Dump(), self.consts.Dump(),
+                list(self.strings), list(self.symbols), errors,
+                self.linenum, self.line_start)
+
+
+    def SetState(self, state):
+        '''Load the tables of a GetState() into this fresh parser and get
+        ready to replay them.
+        '''
+        (tokens, comments, checkpoints, consts, strings, symbols, errors,
+         self.linenum, self.line_start) = state
+        self.token_descs.Load(tokens)
+        self.comments = TokenTable(self.generation)
+        self.comments.Load(comments)
+        self.checkpoints.Load(checkpoints)
+        self.consts.Load(consts)
+        for s in strings:
+            self.strings.append(s)
+        for s in symbols:
+            self.symbols.append(s)
+        for symbol, err_id in errors:
+            self.err_descs.append({'symbol':symbol, 'err_id':err_id})
+        self.stream.Seek(len(self.stream.buf))
+        self.__Rewind(0, 0)
+
+
+    def Relex(self, source, pos, removed, added):
+        '''Bring the tokens up to date with an edited source.
+
+        -source is the whole source text after the edit, it is not
+         decoded, so pass it in the form of stream.buf.
+        -pos is where the edit starts, removed and added are the numbers
+         of characters deleted and inserted there.
+        -Return (start, stop, old_stop): token_descs[start:stop] are new,
+         they replaced the tokens [start:old_stop] of the old source.
+
+        Lexing restarts at the last checkpoint before the edit and stops
+        at the first line start behind the edit where the old source had
+        a checkpoint too. From there on, the old tokens are kept and only
+        moved by the change in offsets and lines. The parser moves to a
+        new generation, tokens got before are no longer valid.
+
+        [Note]:
+        -The value tables are not compacted, values of removed tokens
+         stay in them.
+        -Comments are not kept up to date, the comment table is emptied.
+        '''
+        # Checkpoints of the whole old source are needed
+        self.Lex()
+
+        tokens, checkpoints = self.token_descs, self.checkpoints
+        old_linenum = self.linenum
+        old_line_start = self.line_start
+        self.line_index = None
+        delta = added - removed
+
+        # A checkpoint is the last line start before a token. Restart at
+        # one whose token is before the edit, the edit may add another
+        # line start in front of the others.
+        i = checkpoints.Find(pos)
+        while i >= 0 and (checkpoints.seqs[i] >= len(tokens) or
+                          tokens.offsets[checkpoints.seqs[i]] >= pos):
+            i -= 1
+        if i < 0:
+            offset, line, seq = 0, 1, 0
+        else:
+            offset = checkpoints.offsets[i]
+            line = checkpoints.lines[i]
+            seq = checkpoints.seqs[i]
+
+        # Lex into empty tables, token seqs are relative to seq then
+        self.generation = next(self._generations)
+        self.token_descs = TokenTable(self.generation)
+        self.comments = TokenTable(self.generation)
+        self.checkpoints = CheckpointTable()
+        self.stream.Reset(source, offset)
+        self.linenum = line
+        self.line_start = offset
+
+        # Batches grow, a small edit converges after a few tokens
+        end = pos + added
+        j = -1
+        checked = 0
+        count = 16
+        while j < 0 and self.__LexBatch(count):
+            count = min(count * 2, self.BATCH)
+            new = self.checkpoints
+            while checked < len(new):
+                if new.offsets[checked] >= end:
+                    j = checkpoints.IndexOf(new.offsets[checked] - delta)
+                    if j >= 0:
+                        break
+                checked += 1
+
+        new_tokens, new_checkpoints = self.token_descs, self.checkpoints
+        if j >= 0:
+            # Converged: the old tokens from checkpoint j on are reused
+            old_stop = checkpoints.seqs[j]
+            line_delta = new_checkpoints.lines[checked] - checkpoints.lines[j]
+            # Drop what was lexed behind the checkpoint
+            cut = new_checkpoints.seqs[checked]
+            new_tokens.Splice(cut, len(new_tokens), TokenTable(), 0, 0)
+            new_checkpoints.Splice(checked + 1, len(new_checkpoints),
+                                   CheckpointTable(), 0, 0, 0, 0)
+            self.stream.Seek(len(source))
+            self.linenum = old_linenum + line_delta
+            self.line_start = old_line_start + delta
+            cp_stop = j + 1
+        else:
+            old_stop = len(tokens)
+            line_delta = 0
+            cp_stop = len(checkpoints)
+
+        tokens.Splice(seq, old_stop, new_tokens, line_delta, delta)
+        checkpoints.Splice(i + 1, cp_stop, new_checkpoints, seq, line_delta,
+                           delta, len(new_tokens) - (old_stop - seq))
+        tokens.generation = self.generation
+        self.token_descs, self.checkpoints = tokens, checkpoints
+        self.comments = TokenTable(self.generation)
+        self.__Rewind(len(tokens), 0)
+        return (seq, seq + len(new_tokens), old_stop)
+
+
+    def Close(self):
+        '''Release the source, e.g. unmap a mapped file. Tokens and values
+        got before stay valid, lexing stops.
+        '''
+        self.stream.Reset('', 0)
+
+
+    def GetLineIndex(self):
+        '''Return the LineIndex of the source, for mapping between
+        offsets and (line, column) positions.
+        '''
+        if self.line_index is None:
+            self.line_index = LineIndex(self.stream.buf)
+        return self.line_index
+
+
     def GetTokenInfo(self, token_desc):
         '''Retrieve the information of a given token descriptor.
 
@@ -594,34 +1238,81 @@ class LuaLexParser:
             (type_id, type_name, sym_idx, sym_value, line_num)
          If the token represents an error, then token_name
          holds the error message.
-        -Return None if token_desc is invalid.
+        -Return None if token_desc is invalid, i.e. it was not
+         returned by GetToken() of this parser.
         '''
-        if (token_desc not in self.token_descs) and \
-           token_desc['type'] != self.TOKENTYPE.index('COMMENTS'):
+        if token_desc.get('gen') != self.generation:
             return None
-        else:
-            line_num = token_desc['line']
-            if token_desc['type'] == self.TOKENTYPE.index('err_descs'):
-                # Special handle needed for error messages
-                type_id = self.TOKENTYPE.index('MSGS')
-                err = self.err_descs[token_desc['index']]
+        seq = token_desc.get('seq', -1)
+        if seq < 0:
+            if token_desc['type'] != self.TYPE_COMMENTS:
+                return None
+        elif seq >= len(self.token_descs):
+            return None
+        return self.__TokenInfo(token_desc)
+
+
+    def GetTokenInfos(self, start = 0, stop = None):
+        '''Retrieve the information of many tokens in one pass.
+
+        -Return a list of GetTokenInfo() tuples, one for each token in
+         token_descs[start:stop]. Comments are not in token_descs.
+        '''
+        # Resolve the value lists once instead of once per token
+        tables = [getattr(self, name, None) for name in self.TOKENTYPE]
+        errors = self.TYPE_ERRORS
+        type_msgs = self.TOKENTYPE.index('MSGS')
+
+        table = self.token_descs
+        rows = itertools.izip(table.types[start:stop],
+                              table.indexes[start:stop],
+                              table.lines[start:stop])
+        infos = []
+        for type_id, sym_idx, line in rows:
+            if type_id == errors:
+                err = self.err_descs[sym_idx]
                 sym_idx = err['err_id']
-                sym_value = err['symbol']
-                type_name = self.MSGS[sym_idx]
-                return (type_id, type_name, sym_idx, sym_value, line_num)
-            elif token_desc['type'] == self.TOKENTYPE.index('COMMENTS'):
-                # Special handle needed for comments
-                type_id = token_desc['type']
-                type_name = self.TOKENTYPE[type_id]
-                sym_idx, sym_value = None, None
-                return (type_id, type_name, sym_idx, sym_value, line_num)
+                infos.append((type_msgs, self.MSGS[sym_idx], sym_idx,
+                              err['symbol'], line))
             else:
-                type_id = token_desc['type']
-                type_name = self.TOKENTYPE[type_id]
-                sym_idx = token_desc['index']
-                sym_list = getattr(self, self.TOKENTYPE[type_id])
-                sym_value = sym_list[sym_idx]
-                return (type_id, type_name, sym_idx, sym_value, line_num)
+                infos.append((type_id, self.TOKENTYPE[type_id], sym_idx,
+                              tables[type_id][sym_idx], line))
+        return infos
+
+
+    def GetTokenInfoView(self, start = 0, stop = None):
+        '''Return a TokenInfoView of token_descs[start:stop].
+
+        -With stop None, the view ends where token_descs ends, so it
+         grows with GetToken() and follows Relex().
+        '''
+        return TokenInfoView(self, start, stop)
+
+
+    def __TokenInfo(self, token_desc):
+        '''GetTokenInfo() without validating token_desc.'''
+        line_num = token_desc['line']
+        if token_desc['type'] == self.TOKENTYPE.index('err_descs'):
+            # Special handle needed for error messages
+            type_id = self.TOKENTYPE.index('MSGS')
+            err = self.err_descs[token_desc['index']]
+            sym_idx = err['err_id']
+            sym_value = err['symbol']
+            type_name = self.MSGS[sym_idx]
+            return (type_id, type_name, sym_idx, sym_value, line_num)
+        elif token_desc['type'] == self.TOKENTYPE.index('COMMENTS'):
+            # Special handle needed for comments
+            type_id = token_desc['type']
+            type_name = self.TOKENTYPE[type_id]
+            sym_idx, sym_value = None, None
+            return (type_id, type_name, sym_idx, sym_value, line_num)
+        else:
+            type_id = token_desc['type']
+            type_name = self.TOKENTYPE[type_id]
+            sym_idx = token_desc['index']
+            sym_list = getattr(self, self.TOKENTYPE[type_id])
+            sym_value = sym_list[sym_idx]
+            return (type_id, type_name, sym_idx, sym_value, line_num)
 
 
     def IsCommentToken(self, token_desc):
@@ -636,22 +1327,125 @@ class LuaLexParser:
         return self.TOKENTYPE[type_id] == 'MSGS'
 
 
-def __main():
-    import sys
+class TokenInfoView(object):
+    '''A read-only sequence of the GetTokenInfo() tuples of the tokens
+    in parser.token_descs[start:stop].
 
-    if len(sys.argv) != 3:
-        return
+    Nothing is stored, a tuple is resolved when its row is read, so the
+    view takes no memory per token. Iterating resolves BATCH rows at a
+    time with GetTokenInfos(). Comments are not in the view.
+    '''
+
+    BATCH = 1024
+
+    def __init__(self, parser, start = 0, stop = None):
+        self.parser = parser
+        self.start = start
+        self.stop = stop
+
+
+    def __Bounds(self):
+        '''Return the (start, stop) seqs of the view in the table now.'''
+        size = len(self.parser.token_descs)
+        stop = size
+        if self.stop is not None:
+            stop = min(self.stop, size)
+        return (min(self.start, stop), stop)
 
-    f = open(sys.argv[2], 'w')
-    lex = LuaLexParser(sys.argv[1])
+
+    def __len__(self):
+        start, stop = self.__Bounds()
+        return stop - start
+
+
+    def __getitem__(self, item):
+        start, stop = self.__Bounds()
+        if isinstance(item, slice):
+            first, last, step = item.indices(stop - start)
+            if step == 1:
+                return self.parser.GetTokenInfos(start + first,
+                                                 start + max(first, last))
+            return [self[i] for i in xrange(first, last, step)]
+
+        if item < 0:
+            item += stop - start
+        if not 0 <= item < stop - start:
+            raise IndexError('token info index out of range')
+        seq = start + item
+        return self.parser.GetTokenInfos(seq, seq + 1)[0]
+
+
+    def __iter__(self):
+        pos = self.__Bounds()[0]
+        while True:
+            stop = self.__Bounds()[1]
+            if pos >= stop:
+                break
+            infos = self.parser.GetTokenInfos(pos,
+                                              min(pos + self.BATCH, stop))
+            for info in infos:
+                yield info
+            pos += len(infos)
+
+
+def DumpTokenInfos(lex, f):
+    '''Write GetTokenInfo() of each remaining token to f.
+
+    -One repr() of the info tuple per line, comments included.
+    -Return the number of tokens written.
+    '''
+    count = 0
     token = lex.GetToken()
     while token:
         info = lex.GetTokenInfo(token)
         f.write(repr(info))
         f.write('\n')
+        count += 1
         token = lex.GetToken()
+    return count
+
+
+def __main():
+    '''usage: LuaLexParser.py [-b] [-m] [--stats] [-jJOBS] in out
+
+    -b writes a binary token file, see LexBinary.
+    -m lexes the input through a memory map.
+    --stats writes the profiling counters to stderr, see LexStats.
+    -jJOBS lexes the source on JOBS processes, see LexParallel. It can
+    not be combined with --stats.
+    '''
+    import sys
+
+    args = sys.argv[1:]
+    flags = [arg for arg in args
+             if arg in ('-b', '-m', '--stats') or arg.startswith('-j')]
+    args = [arg for arg in args if arg not in flags]
+    binary = '-b' in flags
+    jobs = [arg[2:] for arg in flags if arg.startswith('-j')]
+    if len(args) != 2:
+        return
+
+    if jobs and '--stats' in flags:
+        # The workers lex with their own parsers
+        sys.exit('--stats does not work with -j')
+    if jobs:
+        from LexParallel import LexParallel
+        lex = LexParallel(args[0], jobs = int(jobs[-1] or 0) or None)
+    else:
+        lex = LuaLexParser(args[0], stats = '--stats' in flags,
+                           mapped = '-m' in flags)
+    if binary:
+        from LexBinary import DumpBinary
+        f = open(args[1], 'wb')
+        DumpBinary(lex, f)
+    else:
+        f = open(args[1], 'w')
+        DumpTokenInfos(lex, f)
     f.close()
 
+    if lex.stats:
+        sys.stderr.write('\n'.join(lex.stats.Report()) + '\n')
+
 
 if __name__ == '__main__':
     __main()
@@ -5,8 +5,16 @@
 #   2010-03-19
 #   + initial version, can handle most unicode encodings.
 #     StringStream supports only ASCIIs.
+#   2026-10-18
+#   + add BufferStream, one immutable buffer and an integer cursor.
+#   + add BufferStream.Reset() for edited sources.
+#   + BufferStream accepts in-memory text, bytes or buffers.
+#   + BufferStream decodes the whole source at once, add TakeUntil().
+#   + BufferStream maps files into memory on request, add MappedBuffer.
 
 import cStringIO
+import re
+import mmap
 
 class StringStream:
     '''This is a simple wrapper of cStringIO.
@@ -84,6 +92,264 @@ class StringStream:
 
 
 
+class MappedBuffer(mmap.mmap):
+    '''A read-only memory map of a file that reads like a str.
+
+    Slicing, find(), rfind() and regex matching work on any mmap, this
+    class adds count(). Pages are read in when they are touched and the
+    OS may drop them again, so files larger than memory can be mapped.
+    '''
+
+    # count() copies the map in slices of this size at most
+    CHUNK = 1 << 20
+
+    def count(self, sub, start = 0, end = None):
+        '''Return the number of sub in self[start:end], like str.count().
+        '''
+        size = len(self)
+        if end is None or end > size:
+            end = size
+        if start < 0:
+            start = max(start + size, 0)
+        if end < 0:
+            end = max(end + size, 0)
+        if len(sub) != 1:
+            # Matches could cross the slices
+            return self[start:end].count(sub)
+
+        n = 0
+        for pos in xrange(start, end, self.CHUNK):
+            n += self[pos:min(pos + self.CHUNK, end)].count(sub)
+        return n
+
+
+
+def MapFile(filename):
+    '''Return a MappedBuffer of a file, or None if it can not be mapped,
+    e.g. it is empty.
+    '''
+    try:
+        f = open(filename, 'rb')
+    except IOError:
+        return None
+    try:
+        return MappedBuffer(f.fileno(), 0, access = mmap.ACCESS_READ)
+    except (ValueError, EnvironmentError):
+        return None
+    finally:
+        # The map stays valid after the file is closed
+        f.close()
+
+
+class BufferStream:
+    '''A string stream made of one immutable buffer and a cursor.
+
+    The whole file, or the in-memory source, is kept once in 'buf' and
+    'pos' is the index of the next character to read. Besides the
+    StringStream interface, runs of characters can be consumed at once
+    with TakeWhile(), Find() and Seek().
+
+    -Supported encodings:
+        Unicode, Unicode-big-endian, UTF-8 with signature, UTF-8 and any
+        other byte encoding, e.g. ANSI code pages.
+
+    The source is decoded once, by its BOM or signature, or as UTF-8 if
+    it has none. 'buf' is a unicode text then and positions count
+    characters. Pure ASCII sources and sources that are no UTF-8 are
+    kept as a str, read byte by byte as before.
+    '''
+
+    # Compiled TakeWhile() patterns, keyed by charset
+    _runs = {}
+
+    def __init__(self, filename, source = None, decode = True,
+                 mapped = False):
+        '''Read in the whole file and decode it.
+
+        If source is not None, it is used instead of the file. It can be
+        a unicode text, a str or any object supporting the buffer
+        protocol, e.g. a bytearray or a memoryview.
+
+        If decode is False, the bytes are kept exactly as they are, e.g.
+        so that positions match the raw text of an edit control.
+
+        If mapped is True, the file is not read but mapped into memory,
+        'buf' is a MappedBuffer then. Its bytes are lexed as they are,
+        like with decode False. Files with a BOM or a signature are read
+        and decoded as usual.
+        '''
+        if source is None and mapped:
+            buf = MapFile(filename)
+            if buf is not None and buf[:2] not in ('\xFF\xFE', '\xFE\xFF') \
+                    and buf[:3] != '\xEF\xBB\xBF':
+                self.buf = buf
+                self.pos = 0
+                return
+            if buf is not None:
+                buf.close()
+
+        if source is None:
+            try:
+                f = open(filename, 'rb')
+                s = f.read()
+            except IOError:
+                s = ''
+            else:
+                f.close()
+        elif isinstance(source, unicode):
+            s = source
+        else:
+            s = self.__ToBytes(source)
+
+        if decode:
+            s = self.__Decode(s)
+
+        self.buf = s
+        self.pos = 0
+
+
+    def __Decode(self, s):
+        '''Decode s in one go, return a unicode text or a str.'''
+        if isinstance(s, unicode):
+            text = s
+            if text[:1] == u'\uFEFF':
+                text = text[1:]
+        elif s[:2] == '\xFF\xFE':
+            text = s[2:].decode('utf-16-le', 'replace')
+        elif s[:2] == '\xFE\xFF':
+            text = s[2:].decode('utf-16-be', 'replace')
+        elif s[:3] == '\xEF\xBB\xBF':
+            text = s[3:].decode('utf-8', 'replace')
+        else:
+            try:
+                s.decode('ascii')
+                return s
+            except UnicodeDecodeError:
+                pass
+            try:
+                text = s.decode('utf-8')
+            except UnicodeDecodeError:
+                # Some code page, lex it byte by byte
+                return s
+
+        # Keep pure ASCII text a str, values read back as before
+        try:
+            return text.encode('ascii')
+        except UnicodeEncodeError:
+            return text
+
+
+    def __ToBytes(self, source):
+        '''Return source as a str.'''
+        if isinstance(source, str):
+            return source
+        if isinstance(source, memoryview):
+            return source.tobytes()
+        return str(buffer(source))
+
+
+    def GetNextChar(self):
+        '''Return the next character in the buffer.
+
+        If EOF is encounted, an empty string(e.g. '') is returned.
+        Reading at EOF still moves the cursor, so a following UnGetChar()
+        does not step back into the buffer.
+        '''
+        pos = self.pos
+        self.pos = pos + 1
+        return self.buf[pos:pos + 1]
+
+
+    def UnGetChar(self, offset = -1):
+        '''Seek back in the string stream.
+
+        'offset' must be negative.
+        Seek back abs(offset) characters from current position.
+        '''
+        if offset >= 0:
+            return
+
+        pos = self.pos + offset
+        if pos < 0:
+            return
+
+        self.pos = pos
+
+
+    def Peek(self, n = 1):
+        '''Return the next n characters without consuming them.'''
+        return self.buf[self.pos:self.pos + n]
+
+
+    def TakeWhile(self, charset):
+        '''Consume the longest run of characters found in charset.
+
+        -Return the run, it is an empty string if the next character
+         is not in charset.
+        '''
+        run = self._runs.get(charset)
+        if run is None:
+            run = re.compile('[%s]*' % re.escape(charset))
+            self._runs[charset] = run
+
+        pos = self.pos
+        end = run.match(self.buf, pos).end()
+        self.pos = end
+        return self.buf[pos:end]
+
+
+    def TakeUntil(self, charset):
+        '''Consume the longest run of characters NOT found in charset.
+
+        -Return the run, e.g. TakeUntil(printables) skips blanks and
+         every non-ASCII character.
+        '''
+        run = self._runs.get((charset, ))
+        if run is None:
+            run = re.compile('[^%s]*' % re.escape(charset))
+            self._runs[(charset, )] = run
+
+        pos = self.pos
+        end = run.match(self.buf, pos).end()
+        self.pos = end
+        return self.buf[pos:end]
+
+
+    def Find(self, delimiter):
+        '''Return the position of the next delimiter, or -1 if none.
+
+        The cursor is not moved, use Seek() to consume up to it.
+        '''
+        return self.buf.find(delimiter, self.pos)
+
+
+    def Tell(self):
+        '''Return the cursor position.'''
+        return self.pos
+
+
+    def Seek(self, pos):
+        '''Move the cursor to pos.'''
+        self.pos = pos
+
+
+    def Reset(self, buf, pos = 0):
+        '''Replace the buffer, e.g. with the text of an edited source,
+        and move the cursor to pos.
+        '''
+        if buf is not self.buf:
+            self.Close()
+        self.buf = buf
+        self.pos = pos
+
+
+    def Close(self):
+        '''Unmap the buffer if it is a MappedBuffer.'''
+        if isinstance(self.buf, MappedBuffer):
+            self.buf.close()
+
+
+
 if __name__ == '__main__':
     import sys
     s = StringStream(sys.argv[1])
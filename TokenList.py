@@ -0,0 +1,246 @@
+# -*- coding: UTF-8 -*-
+# @file:    TokenList.py
+# @author:  zombie.fml<zombiefml@gmail.com>
+# @change:
+#   2026-10-18
+#   + initial version, virtual token and error lists.
+#   + filter rows through the position indexes of the token table.
+#   + add GetRowSpan() for navigation by offsets.
+#   + read rows through a TokenInfoView of the parser.
+#   + keep the rows in a ShiftArray, edits move the rows after them lazily.
+#   + read the token table under the parser lock.
+
+import wx
+import bisect
+from LuaLexParser import LuaLexParser
+from LexTables import ShiftArray
+
+
+class TokenListCtrl(wx.ListCtrl):
+    '''A virtual ListCtrl showing the tokens of a LuaLexParser.
+
+    Rows are not stored in the control. Their text and colour are read on
+    demand from the token table of 'parser', so only the visible rows
+    cost anything. 'rows' holds the seq of the token shown in each row,
+    in increasing order.
+
+    'types' is the set of token types to show, None to show them all.
+    'lines' is the (first, last) range of physical lines to show, None
+    for all.
+
+    The token table is read while holding parser.lock, a LexFrame.LexJob
+    may be lexing into it on its thread.
+    '''
+
+    COLUMNS = ('Id', 'Class', 'Index', 'Symbol', 'Line number')
+
+    # Rows measured by AutoSizeColumns()
+    SAMPLE = 200
+
+    def __init__(self, parent, ID, types = None):
+        wx.ListCtrl.__init__(self, parent, ID, style = wx.LC_REPORT
+                             | wx.LC_SINGLE_SEL | wx.LC_VIRTUAL)
+        for i, name in enumerate(self.COLUMNS):
+            self.InsertColumn(i, name)
+
+        self.parser = None
+
+        # TokenInfoView of all tokens of parser, rows are read from it
+        self.infos = None
+        self.types = types
+        self.lines = None
+        self.rows = ShiftArray('i')
+
+        # OnGetItemText() is called once per column, resolve a row once
+        self.cache = (-1, None)
+
+        self.err_attr = wx.ListItemAttr()
+        self.err_attr.SetTextColour(wx.RED)
+
+        self.AutoSizeColumns()
+
+
+    def SetParser(self, parser):
+        '''Show the tokens of parser, no rows are shown until AddRange().
+        '''
+        self.parser = parser
+        self.infos = None
+        if parser is not None:
+            self.infos = parser.GetTokenInfoView()
+        self.rows = ShiftArray('i')
+        self.UpdateCount()
+
+
+    def SetFilter(self, types, lines = None):
+        '''Show the tokens of the given types and lines only.
+
+        It costs O(k) for k shown tokens, see TokenTable.Select().
+        '''
+        self.types = types
+        self.lines = lines
+        self.rows = ShiftArray('i')
+        if self.parser is not None:
+            self.rows.extend(self.__Match(0, len(self.parser.token_descs)))
+        self.UpdateCount()
+
+
+    def AddRange(self, start, stop):
+        '''Add the matching tokens of token_descs[start:stop].
+
+        'start' must not be less than the seq of any row.
+        '''
+        self.rows.extend(self.__Match(start, stop))
+        self.UpdateCount()
+
+
+    def Splice(self, start, stop, old_stop):
+        '''Follow an edit of the source.
+
+        The arguments are the tuple returned by LuaLexParser.Relex().
+        '''
+        if self.lines is not None:
+            # Lines after the edit may have moved in or out of the range
+            self.SetFilter(self.types, self.lines)
+            return
+
+        rows = self.rows
+        i = bisect.bisect_left(rows, start)
+        j = bisect.bisect_left(rows, old_stop)
+        rows.Splice(i, j, self.__Match(start, stop), 0, stop - old_stop)
+        self.UpdateCount()
+
+
+    def __Match(self, start, stop):
+        '''Return the seqs of the shown tokens in token_descs[start:stop].
+        '''
+        table = self.parser.token_descs
+        with self.parser.lock:
+            if self.lines is not None:
+                index = self.parser.GetLineIndex()
+                first = min(self.lines[0], len(index))
+                last = min(self.lines[1], len(index))
+                first, last = table.OffsetRange(index.LineStart(first),
+                                                index.LineEnd(last))
+                start, stop = max(start, first), min(stop, last)
+            return table.Select(self.types, start, stop)
+
+
+    def UpdateCount(self):
+        '''Tell the control how many rows there are, repaint them.'''
+        self.cache = (-1, None)
+        self.SetItemCount(len(self.rows))
+        self.Refresh()
+
+
+    def GetRowInfo(self, item):
+        '''Return the GetTokenInfo() tuple of a row.'''
+        if self.cache[0] != item:
+            seq = self.rows[item]
+            with self.parser.lock:
+                self.cache = (item, self.infos[seq])
+        return self.cache[1]
+
+
+    def GetRowSpan(self, item):
+        '''Return the (offset, end) of the token of a row, None if the
+        row is no token.
+        '''
+        with self.parser.lock:
+            token = self.parser.token_descs[self.rows[item]]
+        return (int(token['offset']), int(token['end']))
+
+
+    def IsErrorRow(self, item):
+        '''Return True if the row shows an error.'''
+        seq = self.rows[item]
+        with self.parser.lock:
+            type_id = self.parser.token_descs.types[seq]
+        return type_id == self.parser.TYPE_ERRORS
+
+
+    def OnGetItemText(self, item, col):
+        type_id, type_name, sym_idx, sym_value, line = self.GetRowInfo(item)
+        if col == 0:
+            return str(item + 1)
+        elif col == 1:
+            return '%d(%s)' % (type_id, type_name)
+        elif col == 2:
+            return str(sym_idx)
+        elif col == 3:
+            return str(sym_value)
+        else:
+            return str(line)
+
+
+    def OnGetItemAttr(self, item):
+        if self.IsErrorRow(item):
+            # Mark errors with red color
+            return self.err_attr
+        return None
+
+
+    def AutoSizeColumns(self):
+        '''Fit the columns to their header and a sample of the rows.
+
+        At most SAMPLE rows, spread over the whole list, are measured.
+        '''
+        count = self.GetItemCount()
+        step = max(1, count // self.SAMPLE)
+        items = range(0, count, step)[:self.SAMPLE]
+        if count and items[-1] != count - 1:
+            # The last row has the widest Id
+            items.append(count - 1)
+
+        for col, name in enumerate(self.COLUMNS):
+            width = self.GetTextExtent(name)[0]
+            for item in items:
+                text = self.OnGetItemText(item, col)
+                width = max(width, self.GetTextExtent(text)[0])
+            self.SetColumnWidth(col, width + 16)
+
+
+
+class ErrorListCtrl(TokenListCtrl):
+    '''A virtual ListCtrl showing the errors of a LuaLexParser.
+
+    The error rows are followed by the lines of 'footer', e.g. a summary.
+    '''
+
+    COLUMNS = ('Result', )
+
+    def __init__(self, parent, ID):
+        self.footer = []
+        TokenListCtrl.__init__(self, parent, ID,
+                               types = set([LuaLexParser.TYPE_ERRORS]))
+
+
+    def SetFooter(self, lines):
+        '''Show lines after the errors.'''
+        self.footer = list(lines)
+        self.UpdateCount()
+
+
+    def UpdateCount(self):
+        self.cache = (-1, None)
+        self.SetItemCount(len(self.rows) + len(self.footer))
+        self.Refresh()
+
+
+    def GetRowSpan(self, item):
+        if item >= len(self.rows):
+            return None
+        return TokenListCtrl.GetRowSpan(self, item)
+
+
+    def OnGetItemText(self, item, col):
+        if item >= len(self.rows):
+            return self.footer[item - len(self.rows)]
+        type_id, type_name, sym_idx, sym_value, line = self.GetRowInfo(item)
+        return 'Line[%d] : "%s" : error %d: %s' % \
+               (line, sym_value, sym_idx, type_name)
+
+
+    def OnGetItemAttr(self, item):
+        if item >= len(self.rows):
+            return None
+        return self.err_attr